@@ -0,0 +1,198 @@
+import argparse
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from bq_query_client import BigQueryQueryClient, BigQueryError, format_bytes
+
+RED = '\033[0;31m'
+GREEN = '\033[0;32m'
+YELLOW = '\033[1;33m'
+BLUE = '\033[0;34m'
+NC = '\033[0m'
+
+
+def preset_reports(config):
+    fact = config.table('orders_fact')
+    return {
+        'row_count': (
+            "Count rows in orders_fact",
+            f"SELECT COUNT(*) AS total_rows FROM {fact}"
+        ),
+        'sample_orders': (
+            "Sample orders",
+            f"SELECT o.order_id, u.user_id, p.product_name, f.quantity, f.price, f.line_total "
+            f"FROM {fact} f "
+            f"JOIN {config.table('order_dim')} o USING (order_key) "
+            f"JOIN {config.table('user_dim')} u USING (user_key) "
+            f"JOIN {config.table('product_dim')} p USING (product_key) "
+            f"LIMIT 10"
+        ),
+        'orders_by_user': (
+            "Orders by user",
+            f"SELECT u.user_id, COUNT(DISTINCT f.order_key) AS num_orders, SUM(f.line_total) AS total_spent "
+            f"FROM {fact} f JOIN {config.table('user_dim')} u USING (user_key) "
+            f"GROUP BY u.user_id ORDER BY total_spent DESC"
+        ),
+        'orders_summary': (
+            "Orders summary table",
+            f"SELECT * FROM {config.table('orders_summary')} LIMIT 10"
+        ),
+        'sales_by_product': (
+            "Sales by product",
+            f"SELECT p.product_id, p.product_name, SUM(f.quantity) AS units_sold, SUM(f.line_total) AS revenue "
+            f"FROM {fact} f JOIN {config.table('product_dim')} p USING (product_key) "
+            f"GROUP BY p.product_id, p.product_name ORDER BY revenue DESC"
+        ),
+    }
+
+
+def format_row(row):
+    return '\t'.join('' if v is None else str(v) for v in row)
+
+
+def write_result(client, name, sql, out, use_cache=True):
+    """Run one query and stream its rows as TSV into `out`; returns the row count"""
+    result = client.query(sql, use_cache=use_cache)
+
+    source = "cache" if result.cached else "BigQuery"
+    out.write(f"{BLUE}{name}{NC} ({source}, dry run: {format_bytes(result.bytes_processed)} scanned)\n")
+    out.write(format_row(result.column_names) + '\n')
+
+    row_count = 0
+    for row in result.rows:
+        out.write(format_row(row) + '\n')
+        row_count += 1
+
+    out.write(f"{GREEN}✓ {row_count} rows{NC}\n\n")
+    return row_count
+
+
+def run_query(client, name, sql, use_cache=True):
+    print(f"\n{BLUE}Running: {name}{NC}")
+    print(f"{YELLOW}Query: {sql}{NC}\n")
+    try:
+        write_result(client, name, sql, sys.stdout, use_cache)
+        return True
+    except BigQueryError as e:
+        print(f"{RED}✗ Query failed: {e}{NC}\n")
+        return False
+
+
+def run_reports_concurrently(client, reports, use_cache=True):
+    """Run reports in parallel, each spooled to a temp file, then print in order"""
+
+    def run_one(report):
+        name, sql = report
+        spool = tempfile.TemporaryFile(mode='w+')
+        try:
+            write_result(client, name, sql, spool, use_cache)
+        except BigQueryError as e:
+            spool.write(f"{RED}✗ {name} failed: {e}{NC}\n\n")
+        spool.seek(0)
+        return spool
+
+    client.access_token()
+    with ThreadPoolExecutor(max_workers=client.config.REPORT_CONCURRENCY) as executor:
+        for spool in executor.map(run_one, reports):
+            with spool:
+                for line in spool:
+                    sys.stdout.write(line)
+
+
+def list_tables(client):
+    print(f"\n{GREEN}Tables in {client.config.BQ_DATASET}:{NC}")
+    for table_id in client.list_tables():
+        print(table_id)
+    print()
+
+
+def interactive(client, reports, use_cache=True):
+    menu = [
+        ('row_count', "Count rows in orders_fact"),
+        ('sample_orders', "Show sample orders (limit 10)"),
+        ('orders_by_user', "Show orders by user"),
+        ('orders_summary', "Show orders summary"),
+        ('sales_by_product', "Sales by product"),
+    ]
+
+    print(f"{GREEN}Available queries:{NC}")
+    print("  1. List all tables in dataset")
+    for idx, (_, label) in enumerate(menu, 2):
+        print(f"  {idx}. {label}")
+    all_option = len(menu) + 2
+    print(f"  {all_option}. Run all reports (concurrently)")
+    print(f"  {all_option + 1}. Custom query")
+    print(f"  {all_option + 2}. Exit")
+    print()
+
+    option = input(f"Select option (1-{all_option + 2}): ").strip()
+    if not option.isdigit():
+        print(f"{RED}Invalid option{NC}")
+        return 1
+    option = int(option)
+
+    if option == 1:
+        list_tables(client)
+    elif 2 <= option < all_option:
+        key = menu[option - 2][0]
+        name, sql = reports[key]
+        return 0 if run_query(client, name, sql, use_cache) else 1
+    elif option == all_option:
+        run_reports_concurrently(client, list(reports.values()), use_cache)
+    elif option == all_option + 1:
+        print(f"\n{YELLOW}Enter your SQL query (press Ctrl+D when done):{NC}")
+        sql = sys.stdin.read()
+        return 0 if run_query(client, "Custom query", sql, use_cache) else 1
+    elif option == all_option + 2:
+        print("Exiting...")
+    else:
+        print(f"{RED}Invalid option{NC}")
+        return 1
+    return 0
+
+
+def main():
+    config = Config()
+    reports = preset_reports(config)
+
+    parser = argparse.ArgumentParser(description="BigQuery query tool for the orders warehouse")
+    parser.add_argument('reports', nargs='*', metavar='REPORT',
+                        help=f"preset reports to run concurrently ({', '.join(reports)}); omit for the interactive menu")
+    parser.add_argument('--all', action='store_true', help="run every preset report")
+    parser.add_argument('--sql', help="run a custom query")
+    parser.add_argument('--list-tables', action='store_true', help="list tables in the dataset")
+    parser.add_argument('--no-cache', action='store_true', help="bypass the local result cache")
+    args = parser.parse_args()
+
+    unknown = [key for key in args.reports if key not in reports]
+    if unknown:
+        parser.error(f"unknown report(s): {', '.join(unknown)}")
+
+    if not config.GCP_PROJECT_ID:
+        print(f"{RED}Error: GCP_PROJECT_ID not set{NC}")
+        return 1
+
+    print(f"{GREEN}=== BigQuery Query Tool ==={NC}\n")
+
+    client = BigQueryQueryClient(config)
+    use_cache = not args.no_cache
+
+    try:
+        if args.list_tables:
+            list_tables(client)
+        elif args.sql:
+            return 0 if run_query(client, "Custom query", args.sql, use_cache) else 1
+        elif args.all or args.reports:
+            selected = reports.keys() if args.all else args.reports
+            run_reports_concurrently(client, [reports[key] for key in selected], use_cache)
+        else:
+            return interactive(client, reports, use_cache)
+    except BigQueryError as e:
+        print(f"{RED}Error: {e}{NC}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+class BigQueryError(Exception):
+    pass
+
+
+_SQL_TOKENS = re.compile(r"""
+    (?P<literal>'''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*"|`(?:\\.|[^`\\])*`)
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+""", re.VERBOSE | re.DOTALL)
+
+
+def _normalize_token(match):
+    return match.group() if match.lastgroup == 'literal' else ' '
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and drop comments / trailing semicolons for cache keys.
+
+    Quoted strings and identifiers are kept verbatim: 'a  b' and 'a b' are
+    different queries.
+    """
+    # The second pass merges the spaces left where comments were removed
+    for _ in range(2):
+        sql = _SQL_TOKENS.sub(_normalize_token, sql)
+    return sql.strip().rstrip(';').strip()
+
+
+class ResultCache:
+    """On-disk cache of query results, one JSON-lines file per key.
+
+    The first line holds the schema, job statistics and the versions the
+    result was computed from, every following line is one row. Files are
+    written under a temporary name and renamed once the last page has
+    arrived, so a partial result is never served. A newer result replaces
+    the file of its key, and once the directory grows past max_bytes the
+    least recently used files are removed.
+    """
+
+    SUFFIX = '.jsonl'
+
+    def __init__(self, directory, max_bytes=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}{self.SUFFIX}")
+
+    def get(self, key, versions):
+        """Header of the cached result, or None if missing or computed from other versions"""
+        path = self.path(key)
+        try:
+            with open(path, 'r') as f:
+                header = json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        if header.get('versions') != versions:
+            return None
+        os.utime(path)
+        return header
+
+    def read_rows(self, key):
+        with open(self.path(key), 'r') as f:
+            f.readline()
+            for line in f:
+                yield json.loads(line)
+
+    def writer(self, key, header):
+        return _CacheWriter(self, self.path(key), header)
+
+    def prune(self):
+        """Remove least recently used results until the cache fits in max_bytes"""
+        if not self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class _CacheWriter:
+    def __init__(self, cache, path, header):
+        self.cache = cache
+        self.path = path
+        # Concurrent reports may run the same query and cache it at once
+        self.tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.file = open(self.tmp_path, 'w')
+        self.file.write(json.dumps(header) + '\n')
+
+    def write(self, row):
+        self.file.write(json.dumps(row) + '\n')
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        self.cache.prune()
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class QueryResult:
+    """Result of a query; rows is a one-shot iterator over lists of values"""
+
+    def __init__(self, schema, bytes_processed, cached, rows, total_rows=None):
+        self.schema = schema
+        self.bytes_processed = bytes_processed
+        self.cached = cached
+        self.rows = rows
+        self.total_rows = total_rows
+
+    @property
+    def column_names(self):
+        return [field['name'] for field in self.schema]
+
+
+class BigQueryQueryClient:
+    """Minimal BigQuery REST client: dry run, paged results, local cache.
+
+    Every query is dry-run first to report bytes scanned and find the
+    referenced tables. SELECT results are cached under the normalized SQL
+    together with each referenced table's lastModifiedTime, so a cache
+    entry goes stale as soon as a load or merge touches one of its tables
+    and is replaced by the next result.
+    """
+
+    def __init__(self, config, token=None):
+        self.config = config
+        self.token = token or config.ACCESS_TOKEN
+        self.cache = ResultCache(config.CACHE_DIR, config.CACHE_MAX_BYTES)
+
+    def access_token(self):
+        if not self.token:
+            try:
+                self.token = subprocess.check_output(
+                    ['gcloud', 'auth', 'print-access-token'], text=True
+                ).strip()
+            except (OSError, subprocess.CalledProcessError) as e:
+                raise BigQueryError(f"Cannot get an access token from gcloud (set BQ_ACCESS_TOKEN instead): {e}") from e
+        return self.token
+
+    def request(self, method, path, body=None, params=None):
+        url = f"{self.config.BQ_API_URL}/projects/{self.config.GCP_PROJECT_ID}/{path}"
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(url, data=data, method=method, headers={
+            'Authorization': f"Bearer {self.access_token()}",
+            'Content-Type': 'application/json',
+        })
+
+        try:
+            with urllib.request.urlopen(req) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode('utf-8', errors='replace')
+            try:
+                detail = json.loads(detail)['error']['message']
+            except (ValueError, KeyError, TypeError):
+                pass
+            raise BigQueryError(f"{method} {path} failed ({e.code}): {detail}") from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise BigQueryError(f"{method} {path} failed: {e}") from e
+
+    def list_tables(self):
+        params = {'maxResults': self.config.PAGE_SIZE}
+        while True:
+            response = self.request('GET', f"datasets/{self.config.BQ_DATASET}/tables", params=params)
+            for table in response.get('tables', []):
+                yield table['tableReference']['tableId']
+            if not response.get('nextPageToken'):
+                return
+            params['pageToken'] = response['nextPageToken']
+
+    def table_last_modified(self, ref):
+        path = f"datasets/{ref['datasetId']}/tables/{ref['tableId']}"
+        table = self.request('GET', path)
+        return table.get('lastModifiedTime')
+
+    def dry_run(self, sql):
+        """Return (bytes_processed, statement_type, referenced_tables) without running"""
+        job = self.request('POST', 'jobs', body={
+            'configuration': {
+                'dryRun': True,
+                'query': {'query': sql, 'useLegacySql': False},
+            },
+            'jobReference': {'location': self.config.BQ_LOCATION},
+        })
+        stats = job.get('statistics', {}).get('query', {})
+        return (
+            int(stats.get('totalBytesProcessed', 0)),
+            stats.get('statementType'),
+            stats.get('referencedTables', []),
+        )
+
+    def cache_key(self, sql):
+        return hashlib.sha256(normalize_sql(sql).encode('utf-8')).hexdigest()
+
+    def table_versions(self, referenced_tables):
+        return [
+            f"{ref['datasetId']}.{ref['tableId']}@{self.table_last_modified(ref)}"
+            for ref in sorted(referenced_tables, key=lambda r: (r['datasetId'], r['tableId']))
+        ]
+
+    def query(self, sql, use_cache=True):
+        bytes_processed, statement_type, referenced_tables = self.dry_run(sql)
+
+        if self.config.MAX_BYTES_BILLED and bytes_processed > self.config.MAX_BYTES_BILLED:
+            raise BigQueryError(
+                f"Query would scan {format_bytes(bytes_processed)}, over the "
+                f"{format_bytes(self.config.MAX_BYTES_BILLED)} limit (BQ_MAX_BYTES_BILLED)"
+            )
+
+        key = versions = None
+        if use_cache and statement_type == 'SELECT':
+            key = self.cache_key(sql)
+            versions = self.table_versions(referenced_tables)
+
+        if key:
+            header = self.cache.get(key, versions)
+            if header is not None:
+                return QueryResult(header['schema'], bytes_processed, True,
+                                   self.cache.read_rows(key), header.get('total_rows'))
+
+        first_page = self.start_query(sql)
+        schema = first_page.get('schema', {}).get('fields', [])
+        total_rows = int(first_page.get('totalRows', 0))
+        rows = self.iter_rows(first_page)
+
+        if key:
+            header = {'schema': schema, 'total_rows': total_rows, 'bytes_processed': bytes_processed, 'versions': versions}
+            rows = self.tee_to_cache(rows, key, header)
+
+        return QueryResult(schema, bytes_processed, False, rows, total_rows)
+
+    def start_query(self, sql):
+        body = {
+            'query': sql,
+            'useLegacySql': False,
+            'location': self.config.BQ_LOCATION,
+            'maxResults': self.config.PAGE_SIZE,
+            'timeoutMs': self.config.QUERY_TIMEOUT_MS,
+        }
+        if self.config.MAX_BYTES_BILLED:
+            body['maximumBytesBilled'] = str(self.config.MAX_BYTES_BILLED)
+
+        response = self.request('POST', 'queries', body=body)
+        self.raise_for_errors(response)
+
+        while not response.get('jobComplete'):
+            time.sleep(0.5)
+            response = self.get_query_results(response['jobReference'])
+
+        return response
+
+    def get_query_results(self, job_ref, page_token=None):
+        params = {
+            'location': job_ref.get('location', self.config.BQ_LOCATION),
+            'maxResults': self.config.PAGE_SIZE,
+            'timeoutMs': self.config.QUERY_TIMEOUT_MS,
+        }
+        if page_token:
+            params['pageToken'] = page_token
+        response = self.request('GET', f"queries/{job_ref['jobId']}", params=params)
+        self.raise_for_errors(response)
+        return response
+
+    def raise_for_errors(self, response):
+        errors = response.get('errors')
+        if errors:
+            raise BigQueryError('; '.join(e.get('message', str(e)) for e in errors))
+
+    def iter_rows(self, page):
+        """Yield rows page by page via getQueryResults; one page in memory at a time"""
+        while True:
+            for row in page.get('rows', []):
+                yield [cell.get('v') for cell in row['f']]
+
+            page_token = page.get('pageToken')
+            if not page_token:
+                return
+            page = self.get_query_results(page['jobReference'], page_token)
+
+    def tee_to_cache(self, rows, key, header):
+        writer = self.cache.writer(key, header)
+        try:
+            for row in rows:
+                writer.write(row)
+                yield row
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+
+
+def format_bytes(num_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if num_bytes < 1024 or unit == 'TB':
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{num_bytes} B"
+        num_bytes /= 1024
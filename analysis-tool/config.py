@@ -0,0 +1,22 @@
+import os
+
+class Config:
+    GCP_PROJECT_ID = os.getenv('GCP_PROJECT_ID')
+    BQ_DATASET = os.getenv('BQ_DATASET', 'etl_warehouse')
+    BQ_LOCATION = os.getenv('BQ_LOCATION', 'EU')
+    
+    # Point at a local stand-in of the BigQuery REST API for testing
+    BQ_API_URL = os.getenv('BQ_API_URL', 'https://bigquery.googleapis.com/bigquery/v2')
+    ACCESS_TOKEN = os.getenv('BQ_ACCESS_TOKEN')
+    
+    PAGE_SIZE = int(os.getenv('BQ_PAGE_SIZE', '1000'))
+    QUERY_TIMEOUT_MS = int(os.getenv('BQ_QUERY_TIMEOUT_MS', '10000'))
+    MAX_BYTES_BILLED = int(os.getenv('BQ_MAX_BYTES_BILLED', '0'))
+    
+    CACHE_DIR = os.getenv('BQ_CACHE_DIR', os.path.expanduser('~/.cache/algolia-bq'))
+    # Least recently used results are removed past this size; 0 disables the cap
+    CACHE_MAX_BYTES = int(os.getenv('BQ_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+    REPORT_CONCURRENCY = int(os.getenv('BQ_REPORT_CONCURRENCY', '4'))
+    
+    def table(self, name):
+        return f"`{self.GCP_PROJECT_ID}.{self.BQ_DATASET}.{name}`"
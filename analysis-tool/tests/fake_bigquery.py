@@ -0,0 +1,194 @@
+import json
+import re
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _query_key(sql):
+    return ' '.join(sql.split()).rstrip(';').strip()
+
+
+class FakeBigQuery(ThreadingHTTPServer):
+    """Local stand-in for the parts of the BigQuery REST API the client uses.
+
+    Queries are registered up front with their schema, rows and dry-run
+    statistics and looked up by whitespace-insensitive SQL. Every request
+    is recorded in `calls` as (method, path) so tests can assert which
+    endpoints were hit.
+
+    Point the analysis tool at it with BQ_API_URL=http://127.0.0.1:<port>
+    and any BQ_ACCESS_TOKEN.
+    """
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.daemon_threads = True
+        self.tables = {}
+        self.queries = {}
+        self.jobs = {}
+        self.calls = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def add_table(self, dataset, table, last_modified='1000'):
+        self.tables[(dataset, table)] = last_modified
+
+    def touch_table(self, dataset, table):
+        self.tables[(dataset, table)] = str(int(self.tables[(dataset, table)]) + 1)
+
+    def add_query(self, sql, columns, rows, bytes_processed=0, tables=(), statement_type='SELECT'):
+        self.queries[_query_key(sql)] = {
+            'schema': [{'name': name, 'type': 'STRING'} for name in columns],
+            'rows': [[str(v) for v in row] for row in rows],
+            'bytes_processed': bytes_processed,
+            'tables': [{'projectId': 'test', 'datasetId': d, 'tableId': t} for d, t in tables],
+            'statement_type': statement_type,
+        }
+
+    def count(self, method, pattern):
+        return sum(1 for m, path in self.calls if m == method and re.search(pattern, path))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {'error': {'code': status, 'message': message}})
+
+    def route(self, method):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = re.sub(r'^/projects/[^/]+/', '', url.path)
+        with self.server.lock:
+            self.server.calls.append((method, path))
+
+        body = None
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+
+        handlers = [
+            ('POST', r'^jobs$', self.insert_job),
+            ('POST', r'^queries$', self.query),
+            ('GET', r'^queries/([^/]+)$', self.get_query_results),
+            ('GET', r'^datasets/([^/]+)/tables$', self.list_tables),
+            ('GET', r'^datasets/([^/]+)/tables/([^/]+)$', self.get_table),
+        ]
+        for handler_method, pattern, handler in handlers:
+            match = re.match(pattern, path)
+            if handler_method == method and match:
+                return handler(params, body, *match.groups())
+        self.send_error_json(404, f"Not found: {method} {path}")
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def lookup(self, sql):
+        return self.server.queries.get(_query_key(sql))
+
+    def insert_job(self, params, body):
+        query = body['configuration']['query']['query']
+        registered = self.lookup(query)
+        if not body['configuration'].get('dryRun'):
+            return self.send_error_json(400, "Only dry-run jobs are supported")
+        if registered is None:
+            return self.send_error_json(400, f"Unrecognized query: {query}")
+        self.send_json(200, {'statistics': {'query': {
+            'totalBytesProcessed': str(registered['bytes_processed']),
+            'statementType': registered['statement_type'],
+            'referencedTables': registered['tables'],
+        }}})
+
+    def query(self, params, body):
+        registered = self.lookup(body['query'])
+        if registered is None:
+            return self.send_error_json(400, f"Unrecognized query: {body['query']}")
+        max_bytes = int(body.get('maximumBytesBilled', 0))
+        if max_bytes and registered['bytes_processed'] > max_bytes:
+            return self.send_error_json(400, "Query exceeded limit for bytes billed")
+
+        job_id = uuid.uuid4().hex
+        self.server.jobs[job_id] = registered
+        self.send_json(200, self.page(job_id, 0, int(body.get('maxResults', 1000))))
+
+    def get_query_results(self, params, body, job_id):
+        if job_id not in self.server.jobs:
+            return self.send_error_json(404, f"Not found: job {job_id}")
+        start = int(params.get('pageToken', 0))
+        self.send_json(200, self.page(job_id, start, int(params.get('maxResults', 1000))))
+
+    def page(self, job_id, start, size):
+        registered = self.server.jobs[job_id]
+        rows = registered['rows']
+        response = {
+            'jobComplete': True,
+            'jobReference': {'projectId': 'test', 'jobId': job_id, 'location': 'EU'},
+            'schema': {'fields': registered['schema']},
+            'totalRows': str(len(rows)),
+            'rows': [{'f': [{'v': v} for v in row]} for row in rows[start:start + size]],
+        }
+        if start + size < len(rows):
+            response['pageToken'] = str(start + size)
+        return response
+
+    def list_tables(self, params, body, dataset):
+        names = sorted(t for d, t in self.server.tables if d == dataset)
+        start = int(params.get('pageToken', 0))
+        size = int(params.get('maxResults', 1000))
+        response = {'tables': [
+            {'tableReference': {'projectId': 'test', 'datasetId': dataset, 'tableId': name}}
+            for name in names[start:start + size]
+        ]}
+        if start + size < len(names):
+            response['nextPageToken'] = str(start + size)
+        self.send_json(200, response)
+
+    def get_table(self, params, body, dataset, table):
+        if (dataset, table) not in self.server.tables:
+            return self.send_error_json(404, f"Not found: Table {dataset}.{table}")
+        self.send_json(200, {
+            'tableReference': {'projectId': 'test', 'datasetId': dataset, 'tableId': table},
+            'lastModifiedTime': self.server.tables[(dataset, table)],
+        })
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9050
+    server = FakeBigQuery(port)
+    server.add_table('etl_warehouse', 'orders_fact')
+    server.add_query(
+        "SELECT COUNT(*) AS total_rows FROM `test.etl_warehouse.orders_fact`",
+        ['total_rows'], [[42]], bytes_processed=1024,
+        tables=[('etl_warehouse', 'orders_fact')]
+    )
+    print(f"Fake BigQuery API on {server.url} (GCP_PROJECT_ID=test)")
+    server.serve_forever()
@@ -0,0 +1,154 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bq_query_client import BigQueryError, BigQueryQueryClient, normalize_sql
+from config import Config
+from fake_bigquery import FakeBigQuery
+
+SQL = "SELECT user_id, total FROM `test.etl_warehouse.orders_fact`"
+
+
+@pytest.fixture
+def fake():
+    server = FakeBigQuery().start()
+    server.add_table('etl_warehouse', 'orders_fact')
+    server.add_query(SQL, ['user_id', 'total'], [[n, n * 10] for n in range(5)],
+                     bytes_processed=2048, tables=[('etl_warehouse', 'orders_fact')])
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(fake, tmp_path):
+    config = Config()
+    config.GCP_PROJECT_ID = 'test'
+    config.BQ_DATASET = 'etl_warehouse'
+    config.BQ_API_URL = fake.url
+    config.CACHE_DIR = str(tmp_path)
+    config.PAGE_SIZE = 2
+    config.MAX_BYTES_BILLED = 0
+    return BigQueryQueryClient(config, token='test')
+
+
+def rows_of(result):
+    return [row for row in result.rows]
+
+
+def test_normalize_sql_keeps_quoted_strings():
+    assert normalize_sql("SELECT * FROM t WHERE s = 'a -- b'") != normalize_sql("SELECT * FROM t WHERE s = 'a -- c'")
+    assert normalize_sql("SELECT 'a  b'") != normalize_sql("SELECT 'a b'")
+    assert normalize_sql('SELECT `my  col` FROM t') == 'SELECT `my  col` FROM t'
+
+
+def test_normalize_sql_drops_comments_and_whitespace_outside_quotes():
+    sql = "SELECT  x -- it's a comment\n  FROM t /* block */ WHERE s = '--' # tail\n;"
+    assert normalize_sql(sql) == "SELECT x FROM t WHERE s = '--'"
+
+
+def test_rows_are_paged_through_get_query_results(client, fake):
+    result = client.query(SQL)
+
+    assert result.column_names == ['user_id', 'total']
+    assert rows_of(result) == [[str(n), str(n * 10)] for n in range(5)]
+    assert result.bytes_processed == 2048
+    assert fake.count('GET', r'^queries/') == 2
+
+
+def test_repeated_and_reformatted_query_is_served_from_cache(client, fake):
+    rows_of(client.query(SQL))
+
+    result = client.query("SELECT user_id,   total\nFROM `test.etl_warehouse.orders_fact`;")
+
+    assert result.cached
+    assert rows_of(result) == [[str(n), str(n * 10)] for n in range(5)]
+    assert fake.count('POST', r'^queries$') == 1
+
+
+def test_cache_goes_stale_when_table_is_modified(client, fake):
+    rows_of(client.query(SQL))
+    fake.touch_table('etl_warehouse', 'orders_fact')
+
+    assert not client.query(SQL).cached
+    assert fake.count('POST', r'^queries$') == 2
+
+
+def test_stale_result_is_replaced_not_kept(client, fake, tmp_path):
+    rows_of(client.query(SQL))
+    fake.touch_table('etl_warehouse', 'orders_fact')
+    rows_of(client.query(SQL))
+
+    assert len(os.listdir(tmp_path)) == 1
+    assert client.query(SQL).cached
+
+
+def test_least_recently_used_results_are_evicted_past_max_bytes(client, fake, tmp_path):
+    other = "SELECT COUNT(*) AS n FROM `test.etl_warehouse.orders_fact`"
+    fake.add_query(other, ['n'], [[5]], tables=[('etl_warehouse', 'orders_fact')])
+    rows_of(client.query(SQL))
+    cached = tmp_path / os.listdir(tmp_path)[0]
+    os.utime(cached, (1, 1))
+    client.cache.max_bytes = os.path.getsize(cached)
+
+    rows_of(client.query(other))
+
+    assert not client.query(SQL).cached
+    assert fake.count('POST', r'^queries$') == 3
+
+
+def test_partially_read_result_is_not_cached(client, fake):
+    next(iter(client.query(SQL).rows))
+
+    assert not client.query(SQL).cached
+
+
+def test_dry_run_over_limit_never_runs_the_query(client, fake):
+    client.config.MAX_BYTES_BILLED = 1024
+
+    with pytest.raises(BigQueryError, match="over the"):
+        client.query(SQL)
+    assert fake.count('POST', r'^jobs$') == 1
+    assert fake.count('POST', r'^queries$') == 0
+
+
+def test_same_query_cached_from_two_threads(client, fake, tmp_path):
+    results = []
+
+    def run():
+        results.append(rows_of(client.query(SQL)))
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 2 and results[0] == results[1]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    assert client.query(SQL).cached
+
+
+def test_unreachable_api_raises_bigquery_error(client, fake):
+    fake.stop()
+
+    with pytest.raises(BigQueryError, match="failed"):
+        client.query(SQL)
+
+
+def test_missing_gcloud_raises_bigquery_error(client, monkeypatch):
+    monkeypatch.setenv('PATH', '')
+    client.token = None
+
+    with pytest.raises(BigQueryError, match="gcloud"):
+        client.access_token()
+
+
+def test_list_tables_follows_page_tokens(client, fake):
+    for name in ['product_dim', 'user_dim', 'order_dim']:
+        fake.add_table('etl_warehouse', name)
+
+    assert list(client.list_tables()) == ['order_dim', 'orders_fact', 'product_dim', 'user_dim']
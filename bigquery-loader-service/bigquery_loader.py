@@ -4,7 +4,12 @@ import os
 import time
 import sys
 import glob
+import logging
+from collections import Counter
 from config import Config
+from structured_log import setup_logging, LogSummary
+
+log = logging.getLogger('bq-loader')
 
 class BigQueryLoader:
     def __init__(self):
@@ -19,111 +24,258 @@ class BigQueryLoader:
         self.storage_client = storage.Client(project=self.config.GCP_PROJECT_ID)
         
         self.processed_files = set()
+        self.stats = Counter(files_loaded=0, rows_loaded=0, rows_merged=0, failures=0)
         
-    def create_tables(self):
-        print("Creating BigQuery tables if they don't exist...")
-        
-        orders_fact_schema = [
-            bigquery.SchemaField("mongodb_id", "STRING"),
-            bigquery.SchemaField("order_id", "INTEGER"),
-            bigquery.SchemaField("user_id", "INTEGER"),
-            bigquery.SchemaField("amount", "FLOAT"),
-            bigquery.SchemaField("status", "STRING"),
-            bigquery.SchemaField("product_id", "INTEGER"),
-            bigquery.SchemaField("product_name", "STRING"),
-            bigquery.SchemaField("quantity", "INTEGER"),
-            bigquery.SchemaField("price", "FLOAT"),
-            bigquery.SchemaField("line_total", "FLOAT"),
-            bigquery.SchemaField("created_at", "TIMESTAMP"),
-            bigquery.SchemaField("updated_at", "TIMESTAMP"),
-            bigquery.SchemaField("processed_at", "TIMESTAMP"),
+        # Dimensions are listed before the fact so a cycle loads new keys
+        # before the fact rows that reference them. Tables with a merge_key
+        # are upserted through a staging table and clustered on that key;
+        # orders are insert-only, so order_dim is appended like the fact.
+        self.tables = [
+            {'name': 'product_dim', 'local_dir': self.config.LOCAL_PRODUCT_DIM_DIR, 'gcs_prefix': 'product_dim', 'merge_key': 'product_key'},
+            {'name': 'user_dim', 'local_dir': self.config.LOCAL_USER_DIM_DIR, 'gcs_prefix': 'user_dim', 'merge_key': 'user_key'},
+            {'name': 'order_dim', 'local_dir': self.config.LOCAL_ORDER_DIM_DIR, 'gcs_prefix': 'order_dim', 'merge_key': None},
+            {'name': 'orders_fact', 'local_dir': self.config.LOCAL_PARQUET_DIR, 'gcs_prefix': 'orders', 'merge_key': None},
         ]
         
-        table_id = f"{self.config.GCP_PROJECT_ID}.{self.config.BQ_DATASET}.orders_fact"
-        table = bigquery.Table(table_id, schema=orders_fact_schema)
+        self.schemas = {
+            'orders_fact': [
+                bigquery.SchemaField("order_key", "INTEGER"),
+                bigquery.SchemaField("user_key", "INTEGER"),
+                bigquery.SchemaField("product_key", "INTEGER"),
+                bigquery.SchemaField("quantity", "INTEGER"),
+                bigquery.SchemaField("price", "FLOAT"),
+                bigquery.SchemaField("line_total", "FLOAT"),
+                bigquery.SchemaField("created_at", "TIMESTAMP"),
+                bigquery.SchemaField("processed_at", "TIMESTAMP"),
+            ],
+            'product_dim': [
+                bigquery.SchemaField("product_key", "INTEGER"),
+                bigquery.SchemaField("product_id", "INTEGER"),
+                bigquery.SchemaField("product_name", "STRING"),
+                bigquery.SchemaField("processed_at", "TIMESTAMP"),
+            ],
+            'user_dim': [
+                bigquery.SchemaField("user_key", "INTEGER"),
+                bigquery.SchemaField("user_id", "INTEGER"),
+                bigquery.SchemaField("first_order_at", "TIMESTAMP"),
+                bigquery.SchemaField("processed_at", "TIMESTAMP"),
+            ],
+            'order_dim': [
+                bigquery.SchemaField("order_key", "INTEGER"),
+                bigquery.SchemaField("order_id", "INTEGER"),
+                bigquery.SchemaField("mongodb_id", "STRING"),
+                bigquery.SchemaField("user_key", "INTEGER"),
+                bigquery.SchemaField("amount", "FLOAT"),
+                bigquery.SchemaField("status", "STRING"),
+                bigquery.SchemaField("created_at", "TIMESTAMP"),
+                bigquery.SchemaField("updated_at", "TIMESTAMP"),
+                bigquery.SchemaField("processed_at", "TIMESTAMP"),
+            ],
+        }
+    
+    def table_id(self, name):
+        return f"{self.config.GCP_PROJECT_ID}.{self.config.BQ_DATASET}.{name}"
         
-        try:
-            table = self.bq_client.create_table(table)
-            print(f"Created table {table.project}.{table.dataset_id}.{table.table_id}")
-        except Exception as e:
-            if "Already Exists" in str(e):
-                print(f"Table {table_id} already exists")
-            else:
-                print(f"Error creating table: {e}")
-                raise
+    def create_tables(self):
+        log.info("creating bigquery tables if they don't exist")
+        
+        merge_keys = {t['name']: t['merge_key'] for t in self.tables}
+        
+        for name, schema in self.schemas.items():
+            table_id = self.table_id(name)
+            table = bigquery.Table(table_id, schema=schema)
+            clustering = [merge_keys[name]] if merge_keys[name] else None
+            table.clustering_fields = clustering
+            
+            try:
+                table = self.bq_client.create_table(table)
+                log.info("table created", extra={'fields': {'table': table_id}})
+            except Exception as e:
+                if "Already Exists" in str(e):
+                    log.info("table already exists", extra={'fields': {'table': table_id}})
+                    self.check_schema(table_id, schema)
+                    self.check_clustering(table_id, clustering)
+                else:
+                    log.exception("error creating table", extra={'fields': {'table': table_id}})
+                    raise
+    
+    def check_schema(self, table_id, schema):
+        """Fail fast when an existing table predates the current schema.
+        
+        Loads into e.g. the old wide orders_fact would otherwise fail on
+        every file without saying why.
+        """
+        aliases = {'INT64': 'INTEGER', 'FLOAT64': 'FLOAT', 'BOOL': 'BOOLEAN'}
+        existing = {
+            field.name: aliases.get(field.field_type, field.field_type)
+            for field in self.bq_client.get_table(table_id).schema
+        }
+        expected = {field.name: field.field_type for field in schema}
+        
+        if existing != expected:
+            missing = sorted(set(expected) - set(existing))
+            extra = sorted(set(existing) - set(expected))
+            changed = sorted(c for c in set(expected) & set(existing) if expected[c] != existing[c])
+            raise ValueError(
+                f"Table {table_id} does not match the star schema "
+                f"(missing: {missing}, unexpected: {extra}, type changed: {changed}). "
+                f"Drop it or migrate it to the new layout before starting the loader."
+            )
+    
+    def check_clustering(self, table_id, clustering):
+        """Cluster existing dimension tables on their merge key, so each MERGE
+        only reads the blocks holding the keys it touches."""
+        table = self.bq_client.get_table(table_id)
+        if clustering and table.clustering_fields != clustering:
+            table.clustering_fields = clustering
+            self.bq_client.update_table(table, ["clustering_fields"])
+            log.info("table clustering updated", extra={'fields': {'table': table_id, 'clustering': clustering}})
     
     def upload_parquet_to_gcs(self, local_path, gcs_path):
-        print(f"Uploading {local_path} to gs://{self.config.GCS_BUCKET}/{gcs_path}")
+        gcs_uri = f"gs://{self.config.GCS_BUCKET}/{gcs_path}"
+        log.debug("uploading", extra={'fields': {'local_path': local_path, 'gcs_uri': gcs_uri}})
         
         try:
             bucket = self.storage_client.bucket(self.config.GCS_BUCKET)
             blob = bucket.blob(gcs_path)
             blob.upload_from_filename(local_path)
-            print(f"Upload complete: gs://{self.config.GCS_BUCKET}/{gcs_path}")
+            log.info("upload complete", extra={'fields': {'local_path': local_path, 'gcs_uri': gcs_uri}})
             return True
         except Exception as e:
-            print(f"Error uploading to GCS: {e}")
+            self.stats['failures'] += 1
+            log.error("error uploading to gcs", extra={'fields': {'local_path': local_path, 'gcs_uri': gcs_uri, 'error': str(e)}})
             return False
     
-    def load_from_gcs_to_bigquery(self, gcs_uri):
-        print(f"Loading from {gcs_uri} to BigQuery...")
+    def merge_from_staging(self, table, staging_id):
+        target_id = self.table_id(table['name'])
+        key = table['merge_key']
+        columns = [field.name for field in self.schemas[table['name']]]
+        updates = ", ".join(f"{c} = S.{c}" for c in columns if c != key)
+        
+        query = f"""
+        MERGE `{target_id}` T
+        USING (
+            SELECT * EXCEPT(_rn) FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY processed_at DESC) AS _rn
+                FROM `{staging_id}`
+            )
+            WHERE _rn = 1
+        ) S
+        ON T.{key} = S.{key}
+        WHEN MATCHED THEN UPDATE SET {updates}
+        WHEN NOT MATCHED THEN INSERT ROW
+        """
+        
+        merge_job = self.bq_client.query(query)
+        merge_job.result()
+        self.stats['rows_merged'] += merge_job.num_dml_affected_rows or 0
+        log.info("merged staging table", extra={'fields': {'table': target_id, 'rows': merge_job.num_dml_affected_rows}})
+    
+    def load_from_gcs_to_bigquery(self, gcs_uris, table):
+        """Load all given files into one table with a single job (and a single
+        MERGE for upserted tables)."""
+        log.debug("loading to bigquery", extra={'fields': {'gcs_uris': gcs_uris, 'table': table['name']}})
         
-        table_id = f"{self.config.GCP_PROJECT_ID}.{self.config.BQ_DATASET}.orders_fact"
+        if table['merge_key']:
+            table_id = self.table_id(f"{table['name']}_staging")
+            write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
+        else:
+            table_id = self.table_id(table['name'])
+            write_disposition = bigquery.WriteDisposition.WRITE_APPEND
         
         job_config = bigquery.LoadJobConfig(
             source_format=bigquery.SourceFormat.PARQUET,
-            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            write_disposition=write_disposition,
         )
         
         try:
             load_job = self.bq_client.load_table_from_uri(
-                gcs_uri,
+                gcs_uris,
                 table_id,
                 job_config=job_config
             )
             
             load_job.result()
             
+            if table['merge_key']:
+                self.merge_from_staging(table, table_id)
+                table_id = self.table_id(table['name'])
+            
             destination_table = self.bq_client.get_table(table_id)
-            print(f"Loaded {load_job.output_rows} rows into {table_id}")
-            print(f"Total rows in table: {destination_table.num_rows}")
+            self.stats['rows_loaded'] += load_job.output_rows or 0
+            log.info("loaded", extra={'fields': {
+                'files': len(gcs_uris),
+                'table': table_id,
+                'rows': load_job.output_rows,
+                'table_rows': destination_table.num_rows,
+            }})
             return True
         except Exception as e:
-            print(f"Error loading to BigQuery: {e}")
+            self.stats['failures'] += 1
+            log.error("error loading to bigquery", extra={'fields': {'gcs_uris': gcs_uris, 'table': table['name'], 'error': str(e)}})
             return False
     
+    def get_parquet_files(self):
+        files = []
+        for table in self.tables:
+            for parquet_file in sorted(glob.glob(f"{table['local_dir']}/*.parquet")):
+                files.append((parquet_file, table))
+        return files
+    
     def get_new_parquet_files(self):
-        parquet_files = glob.glob(f"{self.config.LOCAL_PARQUET_DIR}/*.parquet")
-        new_files = [f for f in parquet_files if f not in self.processed_files]
-        return new_files
+        return [(f, table) for f, table in self.get_parquet_files() if f not in self.processed_files]
     
-    def process_file(self, parquet_file):
-        filename = os.path.basename(parquet_file)
-        gcs_path = f"orders/{filename}"
+    def process_files(self, parquet_files, table):
+        """Upload the files, then load them into the table in one job.
         
-        if self.upload_parquet_to_gcs(parquet_file, gcs_path):
-            gcs_uri = f"gs://{self.config.GCS_BUCKET}/{gcs_path}"
-            
-            if self.load_from_gcs_to_bigquery(gcs_uri):
-                self.processed_files.add(parquet_file)
-                return True
+        Files that failed to upload or load stay unprocessed and are retried
+        on the next cycle. Returns the number of files loaded.
+        """
+        gcs_uris = []
+        uploaded = []
+        for parquet_file in parquet_files:
+            gcs_path = f"{table['gcs_prefix']}/{os.path.basename(parquet_file)}"
+            if self.upload_parquet_to_gcs(parquet_file, gcs_path):
+                gcs_uris.append(f"gs://{self.config.GCS_BUCKET}/{gcs_path}")
+                uploaded.append(parquet_file)
+        
+        if not uploaded or not self.load_from_gcs_to_bigquery(gcs_uris, table):
+            return 0
         
-        return False
+        self.processed_files.update(uploaded)
+        self.stats['files_loaded'] += len(uploaded)
+        return len(uploaded)
+    
+    def process_by_table(self, files):
+        """Load (file, table) pairs with one job per table, in table order"""
+        loaded = 0
+        for table in self.tables:
+            table_files = [f for f, t in files if t is table]
+            if not table_files:
+                continue
+            try:
+                log.debug("processing", extra={'fields': {'files': len(table_files), 'table': table['name']}})
+                loaded += self.process_files(table_files, table)
+            except Exception:
+                self.stats['failures'] += 1
+                log.exception("error processing files", extra={'fields': {'table': table['name']}})
+        return loaded
     
     def run_summary_query(self):
-        print("\nRunning summary aggregation query...")
+        log.info("running summary aggregation query")
         
         query = f"""
-        CREATE OR REPLACE TABLE `{self.config.GCP_PROJECT_ID}.{self.config.BQ_DATASET}.orders_summary` AS
+        CREATE OR REPLACE TABLE `{self.table_id('orders_summary')}` AS
         SELECT
-            user_id,
-            COUNT(DISTINCT order_id) as total_orders,
-            SUM(line_total) as total_amount,
-            SUM(quantity) as total_items,
-            MAX(created_at) as last_order_date,
+            u.user_id,
+            COUNT(DISTINCT f.order_key) as total_orders,
+            SUM(f.line_total) as total_amount,
+            SUM(f.quantity) as total_items,
+            MAX(f.created_at) as last_order_date,
             CURRENT_TIMESTAMP() as computed_at
-        FROM `{self.config.GCP_PROJECT_ID}.{self.config.BQ_DATASET}.orders_fact`
-        GROUP BY user_id
+        FROM `{self.table_id('orders_fact')}` f
+        JOIN `{self.table_id('user_dim')}` u USING (user_key)
+        GROUP BY u.user_id
         ORDER BY total_amount DESC
         """
         
@@ -131,68 +283,71 @@ class BigQueryLoader:
             query_job = self.bq_client.query(query)
             query_job.result()
             
-            print("Summary table created successfully")
+            log.info("summary table created", extra={'fields': {'table': self.table_id('orders_summary')}})
             
             results = self.bq_client.query(f"""
-                SELECT * FROM `{self.config.GCP_PROJECT_ID}.{self.config.BQ_DATASET}.orders_summary`
+                SELECT * FROM `{self.table_id('orders_summary')}`
                 LIMIT 10
             """).result()
             
-            print("\nTop 10 users by total amount:")
-            for row in results:
-                print(f"User {row.user_id}: {row.total_orders} orders, ${row.total_amount:.2f}")
-        except Exception as e:
-            print(f"Error running summary query: {e}")
+            log.info("top users by total amount", extra={'fields': {'users': [
+                {'user_id': row.user_id, 'total_orders': row.total_orders, 'total_amount': round(row.total_amount, 2)}
+                for row in results
+            ]}})
+        except Exception:
+            log.exception("error running summary query")
     
     def monitor_and_load(self):
-        print(f"Starting continuous monitoring of {self.config.LOCAL_PARQUET_DIR}")
-        print(f"Checking for new files every {self.config.CHECK_INTERVAL} seconds")
-        print("Press Ctrl+C to stop\n")
+        log.info("monitoring started", extra={'fields': {
+            'directories': [t['local_dir'] for t in self.tables],
+            'check_interval': self.config.CHECK_INTERVAL,
+        }})
+        
+        summary = LogSummary(log, self.config.LOG_SUMMARY_INTERVAL, lambda: dict(self.stats)).start()
         
         try:
             while True:
                 new_files = self.get_new_parquet_files()
                 
                 if new_files:
-                    print(f"\nFound {len(new_files)} new file(s)")
-                    
-                    for parquet_file in new_files:
-                        try:
-                            print(f"\nProcessing: {parquet_file}")
-                            self.process_file(parquet_file)
-                        except Exception as e:
-                            print(f"Error processing {parquet_file}: {e}")
-                else:
-                    print(".", end="", flush=True)
+                    log.info("found new files", extra={'fields': {'count': len(new_files)}})
+                    self.process_by_table(new_files)
                 
                 time.sleep(self.config.CHECK_INTERVAL)
                 
         except KeyboardInterrupt:
-            print("\n\nStopping monitor...")
+            log.info("stopping monitor")
             self.run_summary_query()
+        finally:
+            summary.stop()
     
     def load_all_existing(self):
-        print("Loading all existing Parquet files...")
+        log.info("loading all existing parquet files")
         
-        parquet_files = glob.glob(f"{self.config.LOCAL_PARQUET_DIR}/*.parquet")
+        parquet_files = self.get_parquet_files()
         
         if not parquet_files:
-            print("No Parquet files found")
+            log.info("no parquet files found")
             return
         
-        print(f"Found {len(parquet_files)} Parquet file(s)")
+        log.info("found parquet files", extra={'fields': {'count': len(parquet_files)}})
         
-        success_count = 0
-        for parquet_file in parquet_files:
-            if self.process_file(parquet_file):
-                success_count += 1
+        success_count = self.process_by_table(parquet_files)
         
-        print(f"\nSuccessfully processed {success_count}/{len(parquet_files)} files")
+        log.info("load complete", extra={'fields': {'succeeded': success_count, 'total': len(parquet_files)}})
         
         if success_count > 0:
             self.run_summary_query()
 
 def main():
+    config = Config()
+    setup_logging(
+        'bq-loader',
+        level=config.LOG_LEVEL,
+        queue_size=config.LOG_QUEUE_SIZE,
+        sampled_per_second=config.LOG_SAMPLED_PER_SECOND
+    )
+    
     loader = BigQueryLoader()
     
     loader.create_tables()
@@ -202,7 +357,7 @@ def main():
     elif loader.config.LOADER_MODE == 'monitor':
         loader.monitor_and_load()
     else:
-        print(f"Unknown mode: {loader.config.LOADER_MODE}")
+        log.error("unknown mode", extra={'fields': {'mode': loader.config.LOADER_MODE}})
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -6,5 +6,13 @@ class Config:
     GCS_BUCKET = os.getenv('GCS_BUCKET')
     
     LOCAL_PARQUET_DIR = os.getenv('LOCAL_PARQUET_DIR', '/output/orders')
+    LOCAL_PRODUCT_DIM_DIR = os.getenv('LOCAL_PRODUCT_DIM_DIR', '/output/product_dim')
+    LOCAL_USER_DIM_DIR = os.getenv('LOCAL_USER_DIM_DIR', '/output/user_dim')
+    LOCAL_ORDER_DIM_DIR = os.getenv('LOCAL_ORDER_DIM_DIR', '/output/order_dim')
     LOADER_MODE = os.getenv('LOADER_MODE', 'monitor')
-    CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', '30'))
\ No newline at end of file
+    CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', '30'))
+    
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_SAMPLED_PER_SECOND = float(os.getenv('LOG_SAMPLED_PER_SECOND', '5'))
+    LOG_SUMMARY_INTERVAL = float(os.getenv('LOG_SUMMARY_INTERVAL', '60'))
\ No newline at end of file
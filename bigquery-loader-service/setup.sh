@@ -6,4 +6,4 @@ set -e
 
 DIR=$(pwd)
 
-docker build -t $BIG_QUERY_LOADER_IMAGE_NAME -f $DIR/Dockerfile $DIR
\ No newline at end of file
+docker build -t $BIG_QUERY_LOADER_IMAGE_NAME -f $DIR/Dockerfile $DIR/..
\ No newline at end of file
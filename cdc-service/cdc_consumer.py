@@ -4,10 +4,18 @@ from pymongo import MongoClient
 from kafka import KafkaProducer
 from kafka.errors import KafkaError
 from config import Config
+from collection_worker import CollectionWorker, oldest_checkpoint
+from structured_log import setup_logging, LogSummary
+from collections import Counter
+import logging
+import os
+import threading
 import time
 import sys
 from bson import ObjectId
 
+log = logging.getLogger('cdc')
+
 class CDCConsumer:
     def __init__(self):
         self.config = Config()
@@ -15,6 +23,15 @@ class CDCConsumer:
         self.kafka_producer = None
         self.resume_token = None
         self.event_counter = 0
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.summary = None
+        self.workers = {}
+        self.last_idle_check_at = 0
+        self.serializers = {
+            'document': self.transform_change_event,
+            'keys': self.transform_change_event_keys,
+        }
         
     def connect_mongodb(self):
         max_retries = 10
@@ -22,21 +39,21 @@ class CDCConsumer:
         
         while retry_count < max_retries:
             try:
-                print(f"Connecting to MongoDB at {self.config.MONGO_HOST}:{self.config.MONGO_PORT}")
+                log.info("connecting to mongodb", extra={'fields': {'host': self.config.MONGO_HOST, 'port': self.config.MONGO_PORT}})
                 self.mongo_client = MongoClient(
                     self.config.mongo_uri,
                     serverSelectionTimeoutMS=5000
                 )
                 self.mongo_client.admin.command('ping')
-                print("Successfully connected to MongoDB")
+                log.info("connected to mongodb")
                 return True
             except Exception as e:
                 retry_count += 1
-                print(f"MongoDB connection attempt {retry_count}/{max_retries} failed: {e}")
+                log.warning("mongodb connection failed", extra={'fields': {'attempt': retry_count, 'max_retries': max_retries, 'error': str(e)}})
                 if retry_count < max_retries:
                     time.sleep(5)
                 else:
-                    print("Failed to connect to MongoDB after maximum retries")
+                    log.error("giving up on mongodb after maximum retries")
                     return False
     
     def connect_kafka(self):
@@ -45,24 +62,97 @@ class CDCConsumer:
         
         while retry_count < max_retries:
             try:
-                print(f"Connecting to Kafka at {self.config.KAFKA_BOOTSTRAP_SERVERS}")
+                log.info("connecting to kafka", extra={'fields': {'brokers': self.config.KAFKA_BOOTSTRAP_SERVERS}})
                 self.kafka_producer = KafkaProducer(
                     bootstrap_servers=self.config.KAFKA_BOOTSTRAP_SERVERS,
                     value_serializer=lambda v: json.dumps(v, default=str).encode('utf-8'),
                     acks='all',
                     retries=3
                 )
-                print("Successfully connected to Kafka")
+                log.info("connected to kafka")
                 return True
             except KafkaError as e:
                 retry_count += 1
-                print(f"Kafka connection attempt {retry_count}/{max_retries} failed: {e}")
+                log.warning("kafka connection failed", extra={'fields': {'attempt': retry_count, 'max_retries': max_retries, 'error': str(e)}})
                 if retry_count < max_retries:
                     time.sleep(5)
                 else:
-                    print("Failed to connect to Kafka after maximum retries")
+                    log.error("giving up on kafka after maximum retries")
                     return False
     
+    def topic_for(self, key):
+        if self.config.WATCH_MODE == 'collection':
+            return self.config.KAFKA_TOPIC
+        topic = self.config.collection_topics.get(key)
+        if topic:
+            return topic
+        # Only cluster-mode keys carry a database; collection names may contain dots
+        database, collection = self.config.MONGO_DATABASE, key
+        if self.config.WATCH_MODE == 'cluster':
+            database, _, collection = key.partition('.')
+        return self.config.KAFKA_TOPIC_TEMPLATE.format(collection=collection, database=database)
+    
+    def serializer_for(self, key):
+        name = self.config.collection_serializers.get(key, self.config.DEFAULT_SERIALIZER)
+        if name not in self.serializers:
+            raise ValueError(f"Unknown serializer '{name}' for {key} (available: {', '.join(self.serializers)})")
+        return self.serializers[name]
+    
+    def get_worker(self, key):
+        worker = self.workers.get(key)
+        if worker is None:
+            if self.config.WATCH_MODE == 'collection':
+                state_dir = self.config.STATE_DIR
+            else:
+                state_dir = os.path.join(self.config.collections_state_dir, key)
+            worker = CollectionWorker(
+                name=key,
+                topic=self.topic_for(key),
+                serializer=self.serializer_for(key),
+                state_dir=state_dir,
+                config=self.config,
+                publish=self.publish_to_kafka
+            )
+            worker.start()
+            self.workers[key] = worker
+            log.info("worker started", extra={'fields': {'collection': key, 'topic': worker.topic}})
+        return worker
+    
+    def start_workers(self):
+        """Create workers for configured collections and any with saved state"""
+        if self.config.WATCH_MODE == 'collection':
+            keys = [self.config.MONGO_COLLECTION]
+        else:
+            keys = list(self.config.watch_collections)
+            state_dir = self.config.collections_state_dir
+            if os.path.isdir(state_dir):
+                keys += [k for k in sorted(os.listdir(state_dir)) if k not in keys]
+        
+        for key in keys:
+            self.get_worker(key)
+    
+    def stop_workers(self):
+        deadline = time.time() + self.config.SPILL_SHUTDOWN_TIMEOUT
+        for worker in self.workers.values():
+            worker.close(max(0, deadline - time.time()))
+    
+    def start_position(self):
+        """Oldest worker checkpoint, so no collection misses events on resume"""
+        checkpoint = oldest_checkpoint(self.workers.values())
+        if checkpoint is None:
+            log.info("no checkpoint found, starting from the current oplog position")
+        else:
+            log.info("resuming change stream from oldest checkpoint", extra={'fields': {'workers': len(self.workers)}})
+        return checkpoint
+    
+    def advance_idle_workers(self):
+        now = time.time()
+        if self.resume_token is None or now - self.last_idle_check_at < self.config.CHECKPOINT_INTERVAL:
+            return
+        self.last_idle_check_at = now
+        for worker in self.workers.values():
+            worker.advance_if_idle(self.resume_token)
+    
     def serialize_document(self, doc):
         if doc is None:
             return None
@@ -82,10 +172,10 @@ class CDCConsumer:
                 serialized[key] = value
         return serialized
     
-    def transform_change_event(self, change):
+    def transform_change_event(self, change, captured_at=None):
         event = {
             'operation': change.get('operationType'),
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': captured_at or datetime.utcnow().isoformat(),
             'database': change.get('ns', {}).get('db'),
             'collection': change.get('ns', {}).get('coll'),
             'document_key': str(change.get('documentKey', {}).get('_id')),
@@ -105,127 +195,207 @@ class CDCConsumer:
         
         return event
     
-    def print_captured_data(self, event):
-        """Print detailed information about captured data"""
+    def transform_change_event_keys(self, change, captured_at=None):
+        """Envelope only, for collections whose consumers just need to know what changed"""
+        return {
+            'operation': change.get('operationType'),
+            'timestamp': captured_at or datetime.utcnow().isoformat(),
+            'database': change.get('ns', {}).get('db'),
+            'collection': change.get('ns', {}).get('coll'),
+            'document_key': str(change.get('documentKey', {}).get('_id')),
+        }
+    
+    def count(self, *keys):
+        with self.stats_lock:
+            for key in keys:
+                self.stats[key] += 1
+    
+    def log_captured_event(self, change):
+        """Sampled per-event log line from the raw change; the full payload only at DEBUG"""
         self.event_counter += 1
+        operation = change.get('operationType')
+        ns = change.get('ns', {})
+        document_key = str(change.get('documentKey', {}).get('_id'))
+        self.count('events_captured', f"captured.{ns.get('coll')}.{operation}")
         
-        print("\n" + "="*80)
-        print(f"CAPTURED EVENT #{self.event_counter}")
-        print("="*80)
-        print(f"Operation Type: {event['operation'].upper()}")
-        print(f"Database: {event['database']}")
-        print(f"Collection: {event['collection']}")
-        print(f"Document ID: {event['document_key']}")
-        print(f"Timestamp: {event['timestamp']}")
-        
-        if event['operation'] == 'insert':
-            print("\n--- ORIGINAL DOCUMENT (from MongoDB) ---")
-            print(json.dumps(event['data'], indent=2, default=str))
-            
-            # Extract key fields for quick view
-            if 'data' in event and event['data']:
-                data = event['data']
-                print("\n--- KEY FIELDS ---")
-                if 'order_id' in data:
-                    print(f"  Order ID: {data.get('order_id')}")
-                if 'user_id' in data:
-                    print(f"  User ID: {data.get('user_id')}")
-                if 'amount' in data:
-                    print(f"  Amount: ${data.get('amount')}")
-                if 'status' in data:
-                    print(f"  Status: {data.get('status')}")
-                if 'products' in data:
-                    print(f"  Products: {len(data.get('products', []))} items")
-                    for idx, product in enumerate(data.get('products', []), 1):
-                        print(f"    {idx}. {product.get('product_name')} (qty: {product.get('quantity')}, price: ${product.get('price')})")
-        
-        elif event['operation'] == 'update':
-            print("\n--- UPDATED FIELDS ---")
-            print(json.dumps(event.get('updated_fields', {}), indent=2, default=str))
-            if event.get('removed_fields'):
-                print("\n--- REMOVED FIELDS ---")
-                print(json.dumps(event['removed_fields'], indent=2, default=str))
-        
-        elif event['operation'] == 'delete':
-            print("\n--- DELETED DOCUMENT ---")
-            print(f"Document with ID {event['document_key']} was deleted")
-        
-        print("="*80 + "\n")
-    
-    def publish_to_kafka(self, event):
+        doc = change.get('fullDocument') or {}
+        log.info("event captured", extra={'sampled': True, 'fields': {
+            'event_number': self.event_counter,
+            'operation': operation,
+            'database': ns.get('db'),
+            'collection': ns.get('coll'),
+            'document_key': document_key,
+            'order_id': doc.get('order_id'),
+            'items': len(doc.get('items') or []),
+        }})
+        
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("event payload", extra={'sampled': True, 'fields': {
+                'document_key': document_key,
+                'full_document': change.get('fullDocument'),
+                'update_description': change.get('updateDescription'),
+            }})
+    
+    def summary_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        for key, worker in self.workers.items():
+            queued, spilled_bytes = worker.buffer.pending()
+            stats[f"queued.{key}"] = queued
+            stats[f"spilled_bytes.{key}"] = spilled_bytes
+            stats[f"dead_lettered.{key}"] = worker.buffer.dead_letter_count
+        return stats
+    
+    def kafka_headers(self, event):
+        """Routing metadata consumers can filter on without decoding the payload"""
+        headers = [('operation', str(event.get('operation')).encode('utf-8'))]
+        if event.get('collection'):
+            headers.append(('collection', event['collection'].encode('utf-8')))
+        headers.append(('schema_version', self.config.EVENT_SCHEMA_VERSION.encode('utf-8')))
+        return headers
+    
+    def publish_to_kafka(self, event, topic):
+        """Hand the event to the producer without waiting for the broker.
+
+        Returns a callable that waits for the acknowledgement, so the spill
+        buffer can keep a window of sends in flight.
+        """
         try:
-            self.print_captured_data(event)
-            
-            future = self.kafka_producer.send(self.config.KAFKA_TOPIC, value=event)
-            record_metadata = future.get(timeout=10)
-            
-            print(f"PUBLISHED TO KAFKA")
-            print(f"   Topic: {record_metadata.topic}")
-            print(f"   Partition: {record_metadata.partition}")
-            print(f"   Offset: {record_metadata.offset}")
-            print(f"   Message Size: {len(json.dumps(event, default=str).encode('utf-8'))} bytes")
-            print(f"   Destination: {self.config.KAFKA_BOOTSTRAP_SERVERS}")
-            print()
+            future = self.kafka_producer.send(topic, value=event, headers=self.kafka_headers(event))
+        except KafkaError as e:
+            return self.publish_failed(topic, e)
+        
+        def wait():
+            try:
+                record_metadata = future.get(timeout=10)
+            except KafkaError as e:
+                return self.publish_failed(topic, e)
             
+            self.count('events_published')
+            log.debug("event published", extra={'sampled': True, 'fields': {
+                'topic': record_metadata.topic,
+                'partition': record_metadata.partition,
+                'offset': record_metadata.offset,
+                'document_key': event.get('document_key'),
+            }})
             return True
-        except KafkaError as e:
-            print(f"FAILED to publish to Kafka: {e}")
-            return False
+        
+        return wait
     
-    def watch_changes(self):
-        db = self.mongo_client[self.config.MONGO_DATABASE]
-        collection = db[self.config.MONGO_COLLECTION]
+    def publish_failed(self, topic, error):
+        self.count('publish_failures')
+        # Retrying e.g. a too-large message would block the collection forever;
+        # raising lets the spill buffer dead-letter it instead.
+        if not error.retriable:
+            raise error
+        log.warning("publish failed", extra={'sampled': True, 'fields': {'topic': topic, 'error': str(error)}})
+        return False
+    
+    def open_stream(self, pipeline):
+        mode = self.config.WATCH_MODE
+        resume_after = self.start_position()
+        
+        if mode == 'collection':
+            db = self.mongo_client[self.config.MONGO_DATABASE]
+            return db[self.config.MONGO_COLLECTION].watch(pipeline, resume_after=resume_after)
+        
+        collections = self.config.watch_collections
+        if mode == 'database':
+            if collections:
+                pipeline.append({'$match': {'ns.coll': {'$in': collections}}})
+            return self.mongo_client[self.config.MONGO_DATABASE].watch(pipeline, resume_after=resume_after)
         
+        if mode == 'cluster':
+            if collections:
+                namespaces = []
+                for key in collections:
+                    database, _, collection = key.partition('.')
+                    namespaces.append({'ns.db': database, 'ns.coll': collection})
+                pipeline.append({'$match': {'$or': namespaces}})
+            return self.mongo_client.watch(pipeline, resume_after=resume_after)
+        
+        raise ValueError(f"Unknown WATCH_MODE: {mode} (expected collection, database or cluster)")
+    
+    def worker_key(self, change):
+        ns = change.get('ns', {})
+        if self.config.WATCH_MODE == 'cluster':
+            return f"{ns.get('db')}.{ns.get('coll')}"
+        if self.config.WATCH_MODE == 'database':
+            return ns.get('coll')
+        return self.config.MONGO_COLLECTION
+    
+    def watch_changes(self):
         pipeline = [
             {'$match': {'operationType': {'$in': ['insert', 'update', 'delete']}}}
         ]
         
-        print("\n" + "="*80)
-        print("CDC CONSUMER STARTED")
-        print("="*80)
-        print(f"Watching: {self.config.MONGO_DATABASE}.{self.config.MONGO_COLLECTION}")
-        print(f"MongoDB: {self.config.MONGO_HOST}:{self.config.MONGO_PORT}")
-        print(f"Kafka Topic: {self.config.KAFKA_TOPIC}")
-        print(f"Kafka Brokers: {self.config.KAFKA_BOOTSTRAP_SERVERS}")
-        print("="*80)
-        print("\nWaiting for changes...\n")
+        if self.config.WATCH_MODE == 'collection':
+            watching = f"{self.config.MONGO_DATABASE}.{self.config.MONGO_COLLECTION}"
+        elif self.config.WATCH_MODE == 'database':
+            watching = f"{self.config.MONGO_DATABASE} ({', '.join(self.config.watch_collections) or 'all collections'})"
+        else:
+            watching = f"cluster ({', '.join(self.config.watch_collections) or 'all namespaces'})"
+        
+        log.info("cdc consumer started", extra={'fields': {
+            'watch_mode': self.config.WATCH_MODE,
+            'watching': watching,
+            'mongodb': f"{self.config.MONGO_HOST}:{self.config.MONGO_PORT}",
+            'routes': {key: worker.topic for key, worker in self.workers.items()},
+            'kafka_brokers': self.config.KAFKA_BOOTSTRAP_SERVERS,
+            'state_dir': self.config.STATE_DIR,
+        }})
         
         try:
-            with collection.watch(pipeline, resume_after=self.resume_token) as stream:
-                for change in stream:
+            with self.open_stream(pipeline) as stream:
+                while stream.alive:
+                    change = stream.try_next()
                     self.resume_token = stream.resume_token
                     
-                    event = self.transform_change_event(change)
-                    self.publish_to_kafka(event)
+                    if change is not None:
+                        worker = self.get_worker(self.worker_key(change))
+                        if not worker.already_buffered(self.resume_token):
+                            self.log_captured_event(change)
+                            worker.put(change, self.resume_token)
+                    
+                    self.advance_idle_workers()
                     
-        except Exception as e:
-            print(f"Error in change stream: {e}")
+        except Exception:
+            log.exception("error in change stream")
             raise
     
     def run(self):
+        setup_logging(
+            'cdc-consumer',
+            level=self.config.LOG_LEVEL,
+            queue_size=self.config.LOG_QUEUE_SIZE,
+            sampled_per_second=self.config.LOG_SAMPLED_PER_SECOND
+        )
+        
         if not self.connect_mongodb():
             sys.exit(1)
         
         if not self.connect_kafka():
             sys.exit(1)
         
+        self.start_workers()
+        self.summary = LogSummary(log, self.config.LOG_SUMMARY_INTERVAL, self.summary_stats).start()
+        
         try:
             self.watch_changes()
         except KeyboardInterrupt:
-            print("\n\n" + "="*80)
-            print(f"CDC Consumer Shutting Down")
-            print(f"   Total Events Processed: {self.event_counter}")
-            print("="*80)
-        except Exception as e:
-            print(f"Fatal error: {e}")
+            log.info("cdc consumer shutting down", extra={'fields': {'events_processed': self.event_counter}})
+        except Exception:
+            log.exception("fatal error")
             sys.exit(1)
         finally:
+            self.stop_workers()
+            self.summary.stop()
             if self.kafka_producer:
                 self.kafka_producer.flush()
                 self.kafka_producer.close()
             if self.mongo_client:
                 self.mongo_client.close()
-            print("CDC consumer stopped\n")
+            log.info("cdc consumer stopped")
 
 if __name__ == "__main__":
     consumer = CDCConsumer()
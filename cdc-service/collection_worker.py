@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from spill_buffer import SpillBuffer
+
+log = logging.getLogger('cdc.worker')
+
+
+def token_position(token):
+    """Sortable position of a change stream resume token in the oplog"""
+    if not token:
+        return ''
+    return token.get('_data', '') if isinstance(token, dict) else str(token)
+
+
+def oldest_checkpoint(workers):
+    """Where a shared change stream must resume so no collection misses events"""
+    checkpoints = [w.checkpoint for w in workers if w.checkpoint is not None]
+    if not checkpoints:
+        return None
+    return min(checkpoints, key=token_position)
+
+
+class CollectionWorker:
+    """Fan-out target for the change events of one collection.
+
+    Each worker owns a SpillBuffer, whose drain thread serializes raw change
+    documents and publishes them to the collection's topic, and its own
+    resume token checkpoint covering only this collection's drained events.
+    With a shared database-level stream the process resumes from the oldest
+    worker checkpoint and every worker skips events it had already drained,
+    or still holds in its spill log, before the restart.
+
+    The cursor thread only hands changes over. When one collection's spill
+    log reaches SPILL_MAX_BYTES, put() blocks and the shared stream stops
+    for every collection until that topic catches up; the others keep
+    draining what they already hold.
+    """
+
+    def __init__(self, name, topic, serializer, state_dir, config, publish):
+        self.name = name
+        self.topic = topic
+        self.serializer = serializer
+        self.config = config
+        self.publish = publish
+        self.checkpoint_path = os.path.join(state_dir, 'resume_token.json')
+
+        self.checkpoint = self.load_checkpoint()
+        self.unsaved_token = None
+        self.last_checkpoint_at = 0
+        self.checkpoint_lock = threading.Lock()
+
+        self.buffer = SpillBuffer(
+            publish=self.publish_change,
+            on_drained=self.on_drained,
+            spill_dir=os.path.join(state_dir, 'spill'),
+            queue_size=config.SPILL_QUEUE_SIZE,
+            segment_bytes=config.SPILL_SEGMENT_BYTES,
+            max_spill_bytes=config.SPILL_MAX_BYTES,
+            retry_interval=config.SPILL_RETRY_INTERVAL,
+            name=name,
+            marker=lambda record: record['resume_token'],
+            send_window=config.SPILL_SEND_WINDOW,
+            cursor_sync_records=config.SPILL_CURSOR_SYNC_RECORDS,
+            cursor_sync_interval=config.SPILL_CURSOR_SYNC_INTERVAL
+        )
+
+        # The change stream resumes from the drained checkpoint, so it will
+        # deliver the spilled events again; they are replayed from disk.
+        self.spilled_through = self.buffer.last_spilled()
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            log.info("no checkpoint", extra={'fields': {'collection': self.name, 'path': self.checkpoint_path}})
+            return None
+
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                token = json.load(f)
+            log.info("checkpoint loaded", extra={'fields': {'collection': self.name, 'path': self.checkpoint_path}})
+            return token
+        except (OSError, ValueError) as e:
+            log.error("could not read checkpoint", extra={'fields': {'collection': self.name, 'path': self.checkpoint_path, 'error': str(e)}})
+            return None
+
+    def save_checkpoint(self, token):
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(token, f, default=str)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def record_checkpoint(self, token, force=False):
+        with self.checkpoint_lock:
+            if token_position(token) < token_position(self.checkpoint):
+                return
+            self.checkpoint = token
+            self.unsaved_token = token
+            now = time.time()
+            if force or now - self.last_checkpoint_at >= self.config.CHECKPOINT_INTERVAL:
+                self.save_checkpoint(token)
+                self.unsaved_token = None
+                self.last_checkpoint_at = now
+
+    def publish_change(self, captured):
+        """Runs on the drain thread: serialize, then publish to this collection's topic"""
+        event = self.serializer(captured['change'], captured['captured_at'])
+        return self.publish(event, self.topic)
+
+    def on_drained(self, record):
+        """Called by the drain thread once an event has reached Kafka"""
+        self.record_checkpoint(record['resume_token'])
+
+    def advance_if_idle(self, token):
+        """Move an idle collection's checkpoint up to the stream position.
+
+        Without this a quiet collection would pin the shared stream's resume
+        point to its last event, however old.
+        """
+        if self.buffer.is_idle():
+            self.record_checkpoint(token)
+
+    def already_buffered(self, token):
+        """True for events published or spilled before this process started"""
+        position = token_position(token)
+        return position <= max(token_position(self.checkpoint), token_position(self.spilled_through))
+
+    def start(self):
+        self.buffer.start()
+
+    def put(self, change, token):
+        captured = {'change': change, 'captured_at': datetime.utcnow().isoformat()}
+        self.buffer.put({'event': captured, 'resume_token': token})
+
+    def close(self, timeout):
+        queued, spilled_bytes = self.buffer.pending()
+        log.info("draining buffer", extra={'fields': {'collection': self.name, 'queued': queued, 'spilled_bytes': spilled_bytes}})
+        self.buffer.close(timeout)
+        with self.checkpoint_lock:
+            if self.unsaved_token is not None:
+                self.save_checkpoint(self.unsaved_token)
+                self.unsaved_token = None
+        log.info("worker stopped", extra={'fields': {
+            'collection': self.name,
+            'published': self.buffer.drained_count,
+            'spilled': self.buffer.spilled_count,
+            'dead_lettered': self.buffer.dead_letter_count,
+        }})
@@ -9,6 +9,64 @@ class Config:
     KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
     KAFKA_TOPIC = os.getenv('KAFKA_TOPIC', 'orders-cdc')
     
+    # collection: watch MONGO_COLLECTION only and publish to KAFKA_TOPIC
+    # database:   one stream over MONGO_DATABASE, fanned out per collection
+    # cluster:    one stream over every database, keyed as "<db>.<collection>"
+    WATCH_MODE = os.getenv('WATCH_MODE', 'collection')
+    WATCH_COLLECTIONS = os.getenv('WATCH_COLLECTIONS', '')
+    KAFKA_TOPIC_TEMPLATE = os.getenv('KAFKA_TOPIC_TEMPLATE', '{collection}-cdc')
+    COLLECTION_TOPICS = os.getenv('COLLECTION_TOPICS', '')
+    DEFAULT_SERIALIZER = os.getenv('DEFAULT_SERIALIZER', 'document')
+    COLLECTION_SERIALIZERS = os.getenv('COLLECTION_SERIALIZERS', '')
+    
+    # Sent as the schema_version Kafka header; bump when the event layout changes
+    EVENT_SCHEMA_VERSION = os.getenv('EVENT_SCHEMA_VERSION', '1')
+    
+    STATE_DIR = os.getenv('STATE_DIR', '/data/cdc-state')
+    CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', '1'))
+    
+    SPILL_QUEUE_SIZE = int(os.getenv('SPILL_QUEUE_SIZE', '10000'))
+    SPILL_SEGMENT_BYTES = int(os.getenv('SPILL_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+    SPILL_MAX_BYTES = int(os.getenv('SPILL_MAX_BYTES', str(1024 * 1024 * 1024)))
+    SPILL_RETRY_INTERVAL = float(os.getenv('SPILL_RETRY_INTERVAL', '5'))
+    SPILL_SHUTDOWN_TIMEOUT = float(os.getenv('SPILL_SHUTDOWN_TIMEOUT', '30'))
+    # Kafka sends in flight per collection before waiting for the oldest ack
+    SPILL_SEND_WINDOW = int(os.getenv('SPILL_SEND_WINDOW', '100'))
+    # Replay position is persisted every N records or T seconds
+    SPILL_CURSOR_SYNC_RECORDS = int(os.getenv('SPILL_CURSOR_SYNC_RECORDS', '1000'))
+    SPILL_CURSOR_SYNC_INTERVAL = float(os.getenv('SPILL_CURSOR_SYNC_INTERVAL', '1'))
+    
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_SAMPLED_PER_SECOND = float(os.getenv('LOG_SAMPLED_PER_SECOND', '5'))
+    LOG_SUMMARY_INTERVAL = float(os.getenv('LOG_SUMMARY_INTERVAL', '60'))
+    
+    @staticmethod
+    def parse_mapping(value):
+        """Parse "a:x,b:y" into {'a': 'x', 'b': 'y'}"""
+        mapping = {}
+        for entry in value.split(','):
+            if entry.strip():
+                key, _, target = entry.partition(':')
+                mapping[key.strip()] = target.strip()
+        return mapping
+    
+    @property
+    def watch_collections(self):
+        return [c.strip() for c in self.WATCH_COLLECTIONS.split(',') if c.strip()]
+    
+    @property
+    def collection_topics(self):
+        return self.parse_mapping(self.COLLECTION_TOPICS)
+    
+    @property
+    def collection_serializers(self):
+        return self.parse_mapping(self.COLLECTION_SERIALIZERS)
+    
+    @property
+    def collections_state_dir(self):
+        return os.path.join(self.STATE_DIR, 'collections')
+    
     @property
     def mongo_uri(self):
         return f"mongodb://{self.MONGO_HOST}:{self.MONGO_PORT}/"
\ No newline at end of file
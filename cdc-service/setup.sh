@@ -6,4 +6,4 @@ set -e
 
 DIR=$(pwd)
 
-docker build -t $CDC_SERVICE_IMAGE_NAME -f $DIR/Dockerfile $DIR
\ No newline at end of file
+docker build -t $CDC_SERVICE_IMAGE_NAME -f $DIR/Dockerfile $DIR/..
\ No newline at end of file
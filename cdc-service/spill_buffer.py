@@ -0,0 +1,441 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger('cdc.spill')
+
+
+class SegmentLog:
+    """Append-only log of JSON lines split into fixed-size segment files.
+
+    A cursor file remembers how far the log has been replayed, so records
+    survive a restart and are read back in the order they were written.
+    Fully replayed segments are deleted. The cursor also keeps marker() of
+    the newest record written, which prepend() does not change while newer
+    records are still waiting, so callers know what the log already holds.
+
+    The cursor is rewritten every `sync_records` appends or commits, or
+    `sync_interval` seconds, and on close(). After a crash the log may
+    replay a few records that were already committed, never skip one.
+    """
+
+    SEGMENT_PREFIX = 'segment-'
+    SEGMENT_SUFFIX = '.log'
+    CURSOR_FILE = 'cursor.json'
+
+    def __init__(self, directory, segment_bytes, marker=None, sync_records=1000, sync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.marker = marker or (lambda record: record)
+        self.sync_records = sync_records
+        self.sync_interval = sync_interval
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._writer = None
+        self._reader = None
+        self._pending = deque()
+        self._pending_bytes = 0
+        self._unsynced = 0
+        self._synced_at = time.time()
+
+        segments = self._list_segments()
+        cursor = self._load_cursor()
+        if cursor is None:
+            cursor = {'segment': segments[0] if segments else 1, 'offset': 0}
+        self._read_segment = cursor['segment']
+        self._read_offset = cursor['offset']
+        self._next_offset = cursor.get('next_offset', 0)
+        self._newest = cursor.get('newest')
+
+        for number in segments:
+            if number < self._read_segment:
+                os.remove(self._segment_path(number))
+        segments = [n for n in segments if n >= self._read_segment]
+
+        if not segments:
+            self._read_segment = max(self._read_segment, 1)
+            self._read_offset = 0
+            self._next_offset = 0
+            self._write_segment = self._read_segment
+        else:
+            if self._read_segment not in segments:
+                self._read_segment = segments[0]
+                self._read_offset = 0
+                self._next_offset = 0
+            # Never append to a segment left over from a previous run: it may
+            # end in a line truncated by a crash.
+            self._write_segment = segments[-1] + 1
+
+        self.size_bytes = sum(
+            os.path.getsize(self._segment_path(n)) for n in segments
+        ) - self._read_offset
+        if self._read_segment + 1 in segments:
+            self.size_bytes -= self._next_offset
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{self.SEGMENT_PREFIX}{number:08d}{self.SEGMENT_SUFFIX}")
+
+    def _list_segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX):
+                numbers.append(int(name[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]))
+        return sorted(numbers)
+
+    def _load_cursor(self):
+        path = os.path.join(self.directory, self.CURSOR_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("unreadable spill cursor, replaying from the first segment", extra={'fields': {'path': path, 'error': str(e)}})
+            return None
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, self.CURSOR_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'segment': self._read_segment,
+                'offset': self._read_offset,
+                'next_offset': self._next_offset,
+                'newest': self._newest,
+            }, f, default=str)
+        os.replace(tmp_path, path)
+        self._unsynced = 0
+        self._synced_at = time.time()
+
+    def _sync_cursor(self):
+        if self._unsynced >= self.sync_records or time.time() - self._synced_at >= self.sync_interval:
+            self._save_cursor()
+
+    def append(self, record):
+        line = (json.dumps(record, default=str) + '\n').encode('utf-8')
+
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._write_segment), 'ab')
+        elif self._writer.tell() >= self.segment_bytes:
+            self._writer.close()
+            self._write_segment += 1
+            self._writer = open(self._segment_path(self._write_segment), 'ab')
+
+        self._writer.write(line)
+        self._writer.flush()
+        self.size_bytes += len(line)
+        self._newest = self.marker(record)
+        self._unsynced += 1
+        self._sync_cursor()
+
+    def peek(self):
+        """Return the oldest unreplayed record, or None if the log is drained."""
+        records = self.read_ahead(1)
+        return records[0] if records else None
+
+    def read_ahead(self, limit):
+        """Return up to `limit` of the oldest unreplayed records, without
+        committing them. Stops at the end of the current segment."""
+        while len(self._pending) < limit:
+            path = self._segment_path(self._read_segment)
+            if self._reader is None:
+                if not os.path.exists(path):
+                    break
+                self._reader = open(path, 'rb')
+                self._reader.seek(self._read_offset)
+
+            line = self._reader.readline()
+            if line.endswith(b'\n'):
+                self._pending.append((json.loads(line), len(line)))
+                self._pending_bytes += len(line)
+                continue
+
+            # Partial or missing line: either the writer is mid-append, or this
+            # segment is finished and replay moves on to the next one.
+            self._reader.seek(self._read_offset + self._pending_bytes)
+            if self._pending or self._read_segment >= self._write_segment:
+                break
+
+            self._reader.close()
+            self._reader = None
+            # Whatever is left is a line truncated by a crash; it will never
+            # be replayed, so stop counting it.
+            self.size_bytes -= os.path.getsize(path) - self._read_offset
+            os.remove(path)
+            self._read_segment += 1
+            self._read_offset = self._next_offset
+            self._next_offset = 0
+            self._save_cursor()
+
+        return [record for record, _ in list(self._pending)[:limit]]
+
+    def commit(self, count=1):
+        """Mark the oldest `count` records returned by read_ahead() as replayed."""
+        for _ in range(min(count, len(self._pending))):
+            _, length = self._pending.popleft()
+            self._pending_bytes -= length
+            self._read_offset += length
+            self.size_bytes -= length
+            self._unsynced += 1
+        self._sync_cursor()
+
+    def prepend(self, records):
+        """Put records ahead of everything not yet replayed.
+
+        They go to a new segment just before the read position; the cursor
+        keeps the offset to resume the current read segment at afterwards.
+        """
+        if not records:
+            return
+        if self.is_empty():
+            self._newest = self.marker(records[-1])
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+        self._pending.clear()
+        self._pending_bytes = 0
+
+        number = self._read_segment - 1
+        path = self._segment_path(number)
+        with open(path + '.tmp', 'wb') as f:
+            for record in records:
+                f.write((json.dumps(record, default=str) + '\n').encode('utf-8'))
+            size = f.tell()
+        os.replace(path + '.tmp', path)
+
+        self._next_offset = self._read_offset
+        self._read_segment = number
+        self._read_offset = 0
+        self.size_bytes += size
+        self._save_cursor()
+
+    def newest(self):
+        """marker() of the newest record not yet replayed, or None if drained."""
+        if self.is_empty():
+            return None
+        return self._newest
+
+    def is_empty(self):
+        return self.peek() is None
+
+    def close(self):
+        if self._unsynced:
+            self._save_cursor()
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+
+class SpillBuffer:
+    """Bounded in-memory queue that overflows to a SegmentLog on disk.
+
+    put() never waits on Kafka: records go to memory until the queue is full
+    and to the segment log after that. While anything is on disk, new records
+    are appended there too so replay order matches arrival order. A background
+    drain thread hands records to publish() oldest first. publish() returns
+    True or False, or a callable that waits for the send and returns one of
+    them; up to `send_window` records are sent before the drain thread waits
+    on the oldest, and results are taken in order. From the first False on
+    the window is sent again after `retry_interval`. on_drained() is called
+    only after a successful publish, so checkpoints never run ahead of what
+    reached Kafka. A record whose publish raises can never be sent: it is
+    appended to the dead-letter file next to the log and skipped.
+
+    Records in memory are always older than those on disk, so on close the
+    unpublished ones are written in front of the log. Everything accepted
+    and not yet published is then on disk, and last_spilled() returns
+    marker() of the newest of them, so the caller knows which re-read events
+    it already holds.
+    """
+
+    DEAD_LETTER_FILE = 'dead_letter.jsonl'
+
+    def __init__(self, publish, on_drained, spill_dir, queue_size,
+                 segment_bytes, max_spill_bytes, retry_interval, name='spill',
+                 marker=None, send_window=100, cursor_sync_records=1000,
+                 cursor_sync_interval=1.0):
+        self.name = name
+        self.publish = publish
+        self.on_drained = on_drained
+        self.max_spill_bytes = max_spill_bytes
+        self.retry_interval = retry_interval
+        self.send_window = send_window
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._log = SegmentLog(spill_dir, segment_bytes, marker,
+                               sync_records=cursor_sync_records,
+                               sync_interval=cursor_sync_interval)
+        self._dead_letter_path = os.path.join(spill_dir, self.DEAD_LETTER_FILE)
+        self._lock = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self._spilling = not self._log.is_empty()
+        self._in_flight = None
+        self.spilled_count = 0
+        self.drained_count = 0
+        self.dead_letter_count = 0
+
+        if self._spilling:
+            log.info("replaying spilled events first", extra={'fields': {'buffer': name, 'spill_dir': spill_dir, 'spilled_bytes': self._log.size_bytes}})
+
+    def start(self):
+        self._thread = threading.Thread(target=self._drain_loop, name=f"drain-{self.name}", daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        with self._lock:
+            if not self._spilling:
+                try:
+                    self._queue.put_nowait(record)
+                    self._lock.notify_all()
+                    return
+                except queue.Full:
+                    log.warning("in-memory queue full, spilling to disk", extra={'fields': {'buffer': self.name, 'queue_size': self._queue.maxsize}})
+                    self._spilling = True
+
+            # Backpressure: the caller, and with it a shared change stream,
+            # waits here until this buffer's topic catches up.
+            while self._log.size_bytes >= self.max_spill_bytes and not self._stopping.is_set():
+                log.warning("spill log full, waiting for kafka to catch up", extra={'sampled': True, 'fields': {'buffer': self.name, 'spilled_bytes': self._log.size_bytes}})
+                self._lock.wait(timeout=self.retry_interval)
+
+            self._log.append(record)
+            self.spilled_count += 1
+            self._lock.notify_all()
+
+    def last_spilled(self):
+        """marker() of the newest record on disk not published yet"""
+        with self._lock:
+            return self._log.newest()
+
+    def pending(self):
+        return self._queue.qsize(), self._log.size_bytes
+
+    def is_idle(self):
+        """True when every record put so far has been published and acknowledged"""
+        with self._lock:
+            return self._in_flight is None and self._queue.empty() and self._log.is_empty()
+
+    def _next_batch(self):
+        """Block until records are available; returns (records, from_disk)."""
+        with self._lock:
+            while not self._stopping.is_set():
+                records = []
+                while len(records) < self.send_window:
+                    try:
+                        records.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if records:
+                    self._in_flight = (records, False)
+                    return records, False
+
+                records = self._log.read_ahead(self.send_window)
+                if records:
+                    self._in_flight = (records, True)
+                    return records, True
+
+                if self._spilling:
+                    log.info("spill log drained, back to in-memory buffering", extra={'fields': {'buffer': self.name}})
+                    self._spilling = False
+
+                self._lock.wait(timeout=1)
+        return [], False
+
+    def _dead_letter(self, record, error):
+        log.error("event cannot be published, moved to dead-letter file", exc_info=True, extra={'fields': {
+            'buffer': self.name,
+            'path': self._dead_letter_path,
+            'error': str(error),
+        }})
+        with open(self._dead_letter_path, 'a') as f:
+            f.write(json.dumps({'error': repr(error), 'record': record}, default=str) + '\n')
+        self.dead_letter_count += 1
+
+    def _send(self, records):
+        """Send records without waiting in between, then collect the results
+        in order. Returns how many leading records are done, published or
+        dead-lettered."""
+        results = []
+        for record in records:
+            try:
+                result = self.publish(record['event'])
+            except Exception as e:
+                result = e
+            results.append(result)
+            if result is False:
+                break
+
+        done = 0
+        for record, result in zip(records, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                if callable(result):
+                    result = result()
+            except Exception as e:
+                self._dead_letter(record, e)
+                result = True
+            if not result:
+                break
+            done += 1
+        return done
+
+    def _drain_loop(self):
+        while not self._stopping.is_set():
+            records, from_disk = self._next_batch()
+
+            while records:
+                done = self._send(records)
+                if done:
+                    with self._lock:
+                        if from_disk:
+                            self._log.commit(done)
+                        self.drained_count += done
+
+                    for record in records[:done]:
+                        self.on_drained(record)
+
+                    records = records[done:]
+                    with self._lock:
+                        self._in_flight = (records, from_disk) if records else None
+                        self._lock.notify_all()
+
+                if records and self._stopping.wait(self.retry_interval):
+                    return
+
+    def close(self, timeout):
+        """Give the drain thread up to `timeout` seconds to empty the buffer.
+
+        Records still in memory afterwards, including those the drain thread
+        was sending, are moved to the front of the spill log, so a restart
+        replays everything that was accepted in its original order.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline and not self.is_idle():
+            time.sleep(0.1)
+
+        self._stopping.set()
+        with self._lock:
+            self._lock.notify_all()
+        if self._thread:
+            self._thread.join(timeout=self.retry_interval + 10)
+
+        with self._lock:
+            unpublished = []
+            if self._in_flight is not None and not self._in_flight[1]:
+                unpublished.extend(self._in_flight[0])
+            while not self._queue.empty():
+                unpublished.append(self._queue.get_nowait())
+            if unpublished:
+                log.info("moving unpublished in-memory events to the spill log", extra={'fields': {'buffer': self.name, 'events': len(unpublished)}})
+                self._log.prepend(unpublished)
+            self._log.close()
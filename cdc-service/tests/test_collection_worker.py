@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collection_worker import CollectionWorker, oldest_checkpoint, token_position
+
+
+class WorkerConfig:
+    CHECKPOINT_INTERVAL = 0
+    SPILL_QUEUE_SIZE = 100
+    SPILL_SEGMENT_BYTES = 1024
+    SPILL_MAX_BYTES = 1024 * 1024
+    SPILL_RETRY_INTERVAL = 0.05
+    SPILL_SEND_WINDOW = 10
+    SPILL_CURSOR_SYNC_RECORDS = 1000
+    SPILL_CURSOR_SYNC_INTERVAL = 1
+
+
+def token(n):
+    return {'_data': f"{n:04X}"}
+
+
+def serialize(change, captured_at):
+    return {'operation': change['operationType'], 'n': change['n'], 'timestamp': captured_at}
+
+
+def make_worker(state_dir, name='orders', publish=None, published=None):
+    if publish is None:
+        def publish(event, topic):
+            published.append((topic, event['n']))
+            return True
+    return CollectionWorker(
+        name=name,
+        topic=f"{name}-cdc",
+        serializer=serialize,
+        state_dir=os.path.join(state_dir, name),
+        config=WorkerConfig(),
+        publish=publish
+    )
+
+
+def change(n):
+    return {'operationType': 'insert', 'n': n}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_token_position_orders_resume_tokens():
+    assert token_position(None) == ''
+    assert token_position(token(9)) < token_position(token(10)) < token_position(token(255))
+
+
+def test_stream_resumes_from_oldest_checkpoint(tmp_path):
+    orders = make_worker(str(tmp_path), 'orders', published=[])
+    customers = make_worker(str(tmp_path), 'customers', published=[])
+    products = make_worker(str(tmp_path), 'products', published=[])
+    orders.record_checkpoint(token(10), force=True)
+    customers.record_checkpoint(token(5), force=True)
+
+    assert oldest_checkpoint([orders, customers, products]) == token(5)
+    assert oldest_checkpoint([products]) is None
+
+
+def test_events_at_or_before_own_checkpoint_are_skipped_after_restart(tmp_path):
+    published = []
+    worker = make_worker(str(tmp_path), published=published)
+    worker.start()
+    for n in range(1, 4):
+        worker.put(change(n), token(n))
+    assert wait_until(lambda: len(published) == 3)
+    worker.close(timeout=5)
+
+    restarted = make_worker(str(tmp_path), published=[])
+    assert restarted.checkpoint == token(3)
+    assert restarted.already_buffered(token(2))
+    assert restarted.already_buffered(token(3))
+    assert not restarted.already_buffered(token(4))
+
+
+def test_spilled_events_are_skipped_but_not_lost_after_restart(tmp_path):
+    worker = make_worker(str(tmp_path), publish=lambda event, topic: False)
+    worker.start()
+    for n in range(1, 4):
+        worker.put(change(n), token(n))
+    worker.close(timeout=0)
+
+    published = []
+    restarted = make_worker(str(tmp_path), published=published)
+    assert restarted.checkpoint is None
+    assert restarted.already_buffered(token(3))
+    assert not restarted.already_buffered(token(4))
+
+    restarted.start()
+    restarted.put(change(4), token(4))
+    assert wait_until(lambda: len(published) == 4)
+    restarted.close(timeout=5)
+    assert published == [('orders-cdc', n) for n in range(1, 5)]
+    assert restarted.checkpoint == token(4)
+
+
+def test_idle_worker_follows_stream_position_but_never_moves_back(tmp_path):
+    worker = make_worker(str(tmp_path), published=[])
+    worker.start()
+    worker.record_checkpoint(token(5), force=True)
+
+    worker.advance_if_idle(token(8))
+    assert worker.checkpoint == token(8)
+
+    worker.record_checkpoint(token(6))
+    assert worker.checkpoint == token(8)
+    worker.close(timeout=5)
+
+
+def test_busy_worker_checkpoint_waits_for_drain(tmp_path):
+    worker = make_worker(str(tmp_path), publish=lambda event, topic: False)
+    worker.start()
+    worker.put(change(1), token(1))
+
+    worker.advance_if_idle(token(8))
+    assert worker.checkpoint is None
+    worker.close(timeout=0)
+
+
+def test_serializer_runs_on_the_drain_thread(tmp_path):
+    threads = []
+
+    def publish(event, topic):
+        threads.append(threading.current_thread().name)
+        return True
+
+    worker = make_worker(str(tmp_path), publish=publish)
+    worker.start()
+    worker.put(change(1), token(1))
+    assert wait_until(lambda: threads)
+    worker.close(timeout=5)
+    assert threads == ['drain-orders']
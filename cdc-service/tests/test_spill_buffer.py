@@ -0,0 +1,193 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from spill_buffer import SegmentLog, SpillBuffer
+
+
+def make_buffer(spill_dir, publish, drained, queue_size=2, send_window=10):
+    return SpillBuffer(
+        publish=publish,
+        on_drained=drained.append,
+        spill_dir=spill_dir,
+        queue_size=queue_size,
+        segment_bytes=1024,
+        max_spill_bytes=1024 * 1024,
+        retry_interval=0.05,
+        send_window=send_window
+    )
+
+
+def record(n):
+    return {'event': n, 'resume_token': {'_data': f"{n:04d}"}}
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def replay(spill_dir):
+    log = SegmentLog(spill_dir, 1024)
+    records = []
+    while True:
+        item = log.peek()
+        if item is None:
+            break
+        records.append(item['event'])
+        log.commit()
+    log.close()
+    return records
+
+
+def test_close_moves_unpublished_memory_records_in_front_of_spilled(tmp_path):
+    started = threading.Event()
+
+    def publish(event):
+        started.set()
+        return False
+
+    buffer = make_buffer(str(tmp_path), publish, [])
+    buffer.start()
+    buffer.put(record(1))
+    started.wait(1)
+    for n in range(2, 7):
+        buffer.put(record(n))
+    buffer.close(timeout=0)
+
+    assert replay(str(tmp_path)) == [1, 2, 3, 4, 5, 6]
+
+
+def test_last_spilled_covers_events_held_before_restart(tmp_path):
+    buffer = make_buffer(str(tmp_path), lambda event: False, [])
+    buffer.start()
+    for n in range(1, 6):
+        buffer.put(record(n))
+    buffer.close(timeout=0)
+
+    drained = []
+    restarted = make_buffer(str(tmp_path), lambda event: True, drained)
+    assert restarted.last_spilled()['resume_token'] == {'_data': '0005'}
+
+    restarted.start()
+    restarted.close(timeout=5)
+    assert [r['event'] for r in drained] == [1, 2, 3, 4, 5]
+    assert restarted.last_spilled() is None
+
+
+def test_last_spilled_after_close_prepends_behind_a_replayed_segment(tmp_path):
+    kafka_up = threading.Event()
+
+    def publish(event):
+        return kafka_up.is_set()
+
+    drained = []
+    buffer = make_buffer(str(tmp_path), publish, drained)
+    buffer.start()
+    for n in range(1, 6):
+        buffer.put(record(n))
+    kafka_up.set()
+    assert wait_until(lambda: len(drained) == 5 and not buffer._spilling)
+
+    kafka_up.clear()
+    buffer.put(record(6))
+    buffer.put(record(7))
+    buffer.close(timeout=0)
+
+    drained = []
+    restarted = make_buffer(str(tmp_path), lambda event: True, drained)
+    assert restarted.last_spilled()['resume_token'] == {'_data': '0007'}
+
+    restarted.start()
+    restarted.put(record(8))
+    restarted.close(timeout=5)
+    assert [r['event'] for r in drained] == [6, 7, 8]
+
+
+def test_truncated_segment_is_not_counted_once_skipped(tmp_path):
+    log = SegmentLog(str(tmp_path), 1024)
+    log.append({'event': 1})
+    log.close()
+    with open(tmp_path / 'segment-00000001.log', 'ab') as f:
+        f.write(b'{"event": 2')
+
+    log = SegmentLog(str(tmp_path), 1024)
+    log.append({'event': 3})
+    assert log.newest() == {'event': 3}
+
+    events = []
+    while not log.is_empty():
+        events.append(log.peek()['event'])
+        log.commit()
+
+    assert events == [1, 3]
+    assert log.size_bytes == 0
+    log.close()
+
+
+def test_event_that_cannot_be_published_is_dead_lettered(tmp_path):
+    def publish(event):
+        if event == 2:
+            raise ValueError("message too large")
+        return True
+
+    drained = []
+    buffer = make_buffer(str(tmp_path), publish, drained)
+    buffer.start()
+    for n in range(1, 4):
+        buffer.put(record(n))
+    buffer.close(timeout=5)
+
+    assert [r['event'] for r in drained] == [1, 2, 3]
+    assert buffer.dead_letter_count == 1
+    with open(tmp_path / SpillBuffer.DEAD_LETTER_FILE) as f:
+        assert '"event": 2' in f.read()
+
+
+def test_window_is_sent_before_acks_are_awaited_and_resent_from_first_failure(tmp_path):
+    calls = []
+    failed = []
+
+    def publish(event):
+        calls.append(('send', event))
+
+        def wait():
+            calls.append(('ack', event))
+            if event == 2 and not failed:
+                failed.append(event)
+                return False
+            return True
+        return wait
+
+    drained = []
+    buffer = make_buffer(str(tmp_path), publish, drained, queue_size=10)
+    for n in range(1, 4):
+        buffer.put(record(n))
+    buffer.start()
+    buffer.close(timeout=5)
+
+    assert calls == [
+        ('send', 1), ('send', 2), ('send', 3), ('ack', 1), ('ack', 2),
+        ('send', 2), ('send', 3), ('ack', 2), ('ack', 3),
+    ]
+    assert [r['event'] for r in drained] == [1, 2, 3]
+
+
+def test_cursor_is_persisted_in_batches_and_on_close(tmp_path):
+    log = SegmentLog(str(tmp_path), 1024, sync_records=10, sync_interval=60)
+    for n in range(1, 5):
+        log.append({'event': n})
+    log.read_ahead(2)
+    log.commit(2)
+
+    reopened = SegmentLog(str(tmp_path), 1024)
+    assert reopened.peek() == {'event': 1}
+    reopened.close()
+
+    log.close()
+    assert replay(str(tmp_path)) == [3, 4]
@@ -0,0 +1,164 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, service, logger, msg + structured fields"""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'service': self.service,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket for records logged with extra={'sampled': True}.
+
+    Per-event detail is tagged as sampled; at most `per_second` of those get
+    through (per message), the rest are counted in `suppressed` and reported
+    by the periodic summary instead of being written.
+    """
+
+    def __init__(self, per_second):
+        super().__init__()
+        self.per_second = per_second
+        self.buckets = {}
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(record.msg, (self.per_second, now))
+            tokens = min(self.per_second, tokens + (now - last) * self.per_second)
+            if tokens >= 1:
+                self.buckets[record.msg] = (tokens - 1, now)
+                return True
+            self.buckets[record.msg] = (tokens, now)
+            self.suppressed += 1
+            return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the logging thread.
+
+    When the queue is full the record is dropped and counted instead of
+    stalling event processing. Only the message is resolved here; JSON
+    formatting happens on the QueueListener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room instead of failing when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+
+class LogSummary:
+    """Logs a 'summary' line every `interval` seconds from a stats callable"""
+
+    def __init__(self, logger, interval, stats):
+        self.logger = logger
+        self.interval = interval
+        self.stats = stats
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='log-summary', daemon=True)
+
+    def start(self):
+        if self.interval > 0:
+            self.thread.start()
+        return self
+
+    def emit(self):
+        fields = dict(self.stats())
+        fields.update(log_stats())
+        self.logger.info("summary", extra={'fields': fields})
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.emit()
+            except Exception:
+                self.logger.exception("summary failed")
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+        self.emit()
+
+
+_handler = None
+_rate_limit = None
+
+
+def setup_logging(service, level='INFO', queue_size=10000, sampled_per_second=5):
+    """Route the root logger through a bounded queue to a JSON stdout writer thread.
+
+    Returns the service logger.
+    """
+    global _handler, _rate_limit
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    _handler = DroppingQueueHandler(log_queue)
+    _rate_limit = RateLimitFilter(sampled_per_second)
+    _handler.addFilter(_rate_limit)
+
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JsonFormatter(service))
+    listener = _Listener(log_queue, writer)
+    listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(level.upper())
+
+    atexit.register(listener.stop)
+    return logging.getLogger(service)
+
+
+def log_stats():
+    if _handler is None:
+        return {}
+    return {'logs_suppressed': _rate_limit.suppressed, 'logs_dropped': _handler.dropped}
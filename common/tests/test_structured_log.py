@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import queue
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from structured_log import DroppingQueueHandler, JsonFormatter, LogSummary, RateLimitFilter
+
+
+def make_record(msg, *args, sampled=False, fields=None, exc_info=None):
+    record = logging.LogRecord('cdc', logging.INFO, __file__, 1, msg, args, exc_info)
+    if sampled:
+        record.sampled = True
+    if fields is not None:
+        record.fields = fields
+    return record
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_rate_limit_counts_suppressed_sampled_records_per_message():
+    limit = RateLimitFilter(per_second=2)
+
+    passed = [limit.filter(make_record("event published", sampled=True)) for _ in range(5)]
+
+    assert passed == [True, True, False, False, False]
+    assert limit.suppressed == 3
+    assert limit.filter(make_record("publish failed", sampled=True))
+    assert limit.filter(make_record("event published"))
+    assert limit.suppressed == 3
+
+
+def test_full_queue_drops_and_counts_instead_of_blocking():
+    log_queue = queue.Queue(maxsize=1)
+    handler = DroppingQueueHandler(log_queue)
+
+    handler.handle(make_record("first %s", 1))
+    handler.handle(make_record("second %s", 2))
+
+    assert handler.dropped == 1
+    queued = log_queue.get_nowait()
+    assert (queued.msg, queued.args) == ("first 1", None)
+
+
+def test_json_layout_puts_fields_after_the_fixed_keys():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record("loaded %s", 'orders', fields={'rows': 3}, exc_info=sys.exc_info())
+
+    line = JsonFormatter('bq-loader').format(record)
+    entry = json.loads(line)
+
+    assert list(entry) == ['ts', 'level', 'service', 'logger', 'msg', 'rows', 'exc']
+    assert entry['service'] == 'bq-loader'
+    assert entry['msg'] == 'loaded orders'
+    assert entry['ts'].endswith('+00:00')
+    assert 'ValueError: boom' in entry['exc']
+    assert ', ' not in line.split('"exc"')[0]
+
+
+def test_summary_logs_stats_on_stop():
+    logger = logging.getLogger('test-summary')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+
+    LogSummary(logger, 0, lambda: {'events_published': 7}).start().stop()
+
+    assert [r.msg for r in handler.records] == ["summary"]
+    assert handler.records[0].fields['events_published'] == 7
@@ -57,6 +57,28 @@ echo ""
 # Check which containers are actually running
 echo -e "${GREEN}Checking which containers are running...${NC}\n"
 
+# Minimum level kept for services that write structured JSON logs
+LOG_MIN_LEVEL=${LOG_MIN_LEVEL:-INFO}
+
+# Keep JSON log lines at or above LOG_MIN_LEVEL, filtering on the level field.
+# Non-JSON lines (JVM, third-party output) are dropped.
+filter_json_logs() {
+    if command -v jq &> /dev/null; then
+        jq -c -R --arg min "$LOG_MIN_LEVEL" '
+            {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50} as $levels
+            | fromjson? | objects | select(.level != null)
+            | select(($levels[.level] // 0) >= ($levels[$min] // 20))'
+    else
+        case $LOG_MIN_LEVEL in
+            DEBUG)   levels='DEBUG|INFO|WARNING|ERROR|CRITICAL' ;;
+            WARNING) levels='WARNING|ERROR|CRITICAL' ;;
+            ERROR)   levels='ERROR|CRITICAL' ;;
+            *)       levels='INFO|WARNING|ERROR|CRITICAL' ;;
+        esac
+        grep -E "^\{.*\"level\":\"($levels)\""
+    fi
+}
+
 # Filter logs based on container type
 filter_logs_by_container() {
     local container=$1
@@ -95,26 +117,17 @@ filter_logs_by_container() {
                 >> "$log_file" 2>&1 || echo "No significant events" >> "$log_file"
             ;;
         
-        *cdc*)
-            echo "=== CDC Consumer Logs ===" >> "$log_file"
-            docker logs "$container" 2>&1 | \
-                grep -iE 'connect|watching|publish|event|insert|update|delete|topic|partition|offset|error|fail|success|started' \
-                >> "$log_file" 2>&1 || echo "No significant events" >> "$log_file"
-            ;;
-        
-        *spark*)
-            echo "=== Spark Processor Logs ===" >> "$log_file"
-            docker logs "$container" 2>&1 | \
-                grep -iE 'creating spark|session created|started|reading|writing|processing|batch|waiting for data|error|fail|warn|completed|fatal' | \
-                grep -viE 'downloading|successful.*jar|fetching|copying|added jar|added file' \
-                >> "$log_file" 2>&1 || echo "No significant events" >> "$log_file"
-            ;;
-        
-        *bq*|*bigquery*)
-            echo "=== BigQuery Loader Logs ===" >> "$log_file"
-            docker logs "$container" 2>&1 | \
-                grep -iE 'creating|uploading|loading|found|processing|table|bucket|success|complete|error|fail|warn|rows|started|monitoring' \
+        # Services logging through common/structured_log.py
+        *cdc*|*spark*|*bq*|*bigquery*)
+            echo "=== Structured Logs (level >= $LOG_MIN_LEVEL) ===" >> "$log_file"
+            docker logs "$container" 2>&1 | filter_json_logs \
                 >> "$log_file" 2>&1 || echo "No significant events" >> "$log_file"
+            if [[ $container == *spark* ]]; then
+                echo "=== Spark JVM Warnings/Errors ===" >> "$log_file"
+                docker logs "$container" 2>&1 | \
+                    grep -v '^{' | grep -E ' (WARN|ERROR) ' \
+                    >> "$log_file" 2>&1 || echo "No JVM warnings or errors" >> "$log_file"
+            fi
             ;;
         
         *)
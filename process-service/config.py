@@ -4,7 +4,26 @@ class Config:
     KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
     KAFKA_TOPIC = os.getenv('KAFKA_TOPIC', 'orders-cdc')
     
+    # Route on the CDC producer's Kafka headers before decoding payloads;
+    # messages without headers fall back to parsing the full JSON
+    HEADER_ROUTING = os.getenv('HEADER_ROUTING', 'true').lower() == 'true'
+    # Headers must match these, or the message is dropped unparsed
+    SOURCE_COLLECTION = os.getenv('SOURCE_COLLECTION', 'orders')
+    SCHEMA_VERSIONS = os.getenv('SCHEMA_VERSIONS', '1')
+    
     CHECKPOINT_LOCATION = os.getenv('CHECKPOINT_LOCATION', '/tmp/spark-checkpoints')
     OUTPUT_PATH = os.getenv('OUTPUT_PATH', '/output/orders')
+    PRODUCT_DIM_PATH = os.getenv('PRODUCT_DIM_PATH', '/output/product_dim')
+    USER_DIM_PATH = os.getenv('USER_DIM_PATH', '/output/user_dim')
+    ORDER_DIM_PATH = os.getenv('ORDER_DIM_PATH', '/output/order_dim')
+    
+    SPARK_APP_NAME = os.getenv('SPARK_APP_NAME', 'OrdersCDCProcessor')
+    
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_SAMPLED_PER_SECOND = float(os.getenv('LOG_SAMPLED_PER_SECOND', '5'))
+    LOG_SUMMARY_INTERVAL = float(os.getenv('LOG_SUMMARY_INTERVAL', '60'))
     
-    SPARK_APP_NAME = os.getenv('SPARK_APP_NAME', 'OrdersCDCProcessor')
\ No newline at end of file
+    @property
+    def schema_versions(self):
+        return [v.strip() for v in self.SCHEMA_VERSIONS.split(',') if v.strip()]
@@ -6,4 +6,4 @@ set -e
 
 DIR=$(pwd)
 
-docker build -t $SPARK_PROCESSOR_IMAGE_NAME -f $DIR/Dockerfile $DIR
\ No newline at end of file
+docker build -t $SPARK_PROCESSOR_IMAGE_NAME -f $DIR/Dockerfile $DIR/..
\ No newline at end of file
@@ -1,18 +1,40 @@
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import from_json, col, explode, current_timestamp, to_timestamp
+from pyspark.sql.functions import from_json, col, explode, map_from_entries, current_timestamp, to_timestamp, xxhash64, broadcast, row_number, countDistinct, min as spark_min, sum as spark_sum
+from pyspark.sql.window import Window
 from pyspark.sql.types import StructType, StructField, StringType, DoubleType, ArrayType, IntegerType
 from config import Config
+from structured_log import setup_logging, LogSummary
+from collections import Counter
+import logging
+import os
 import sys
 import time
 
+log = logging.getLogger('spark')
+
 class SparkCDCProcessor:
+    # Star schema: the exploded fact keeps surrogate keys and measures only,
+    # descriptive attributes live once per key in the dimension tables.
+    FACT_COLUMNS = [
+        "order_key", "user_key", "product_key",
+        "quantity", "price", "line_total",
+        "created_at", "processed_at"
+    ]
+    
     def __init__(self):
         self.config = Config()
         self.spark = None
         self.batch_counter = 0
+        self.stats = Counter(
+            rows_written=0, new_products=0, new_users=0, empty_batches=0,
+            skipped_update=0, skipped_delete=0, skipped_other_operations=0,
+            skipped_other_collections=0, unknown_schema_version=0
+        )
+        self.summary = None
+        self.dimension_state = {}
         
     def create_spark_session(self):
-        print("Creating Spark session...")
+        log.info("creating spark session")
         self.spark = SparkSession.builder \
             .appName(self.config.SPARK_APP_NAME) \
             .config("spark.jars.packages", "org.apache.spark:spark-sql-kafka-0-10_2.12:3.5.0") \
@@ -20,9 +42,18 @@ class SparkCDCProcessor:
             .getOrCreate()
         
         self.spark.sparkContext.setLogLevel("WARN")
-        print("Spark session created successfully")
+        log.info("spark session created")
         return self.spark
     
+    def define_envelope_fields(self):
+        return [
+            StructField("operation", StringType(), True),
+            StructField("timestamp", StringType(), True),
+            StructField("database", StringType(), True),
+            StructField("collection", StringType(), True),
+            StructField("document_key", StringType(), True)
+        ]
+    
     def define_schema(self):
         item_schema = StructType([
             StructField("product_id", IntegerType(), True),
@@ -42,20 +73,18 @@ class SparkCDCProcessor:
             StructField("updated_at", StringType(), True)
         ])
         
-        cdc_schema = StructType([
-            StructField("operation", StringType(), True),
-            StructField("timestamp", StringType(), True),
-            StructField("database", StringType(), True),
-            StructField("collection", StringType(), True),
-            StructField("document_key", StringType(), True),
+        cdc_schema = StructType(self.define_envelope_fields() + [
             StructField("data", data_schema, True)
         ])
         
         return cdc_schema
     
     def read_from_kafka(self):
-        print(f"Reading from Kafka topic: {self.config.KAFKA_TOPIC}")
-        print(f"Kafka brokers: {self.config.KAFKA_BOOTSTRAP_SERVERS}")
+        log.info("reading from kafka", extra={'fields': {
+            'topic': self.config.KAFKA_TOPIC,
+            'brokers': self.config.KAFKA_BOOTSTRAP_SERVERS,
+            'header_routing': self.config.HEADER_ROUTING,
+        }})
         
         df = self.spark \
             .readStream \
@@ -63,18 +92,67 @@ class SparkCDCProcessor:
             .option("kafka.bootstrap.servers", self.config.KAFKA_BOOTSTRAP_SERVERS) \
             .option("subscribe", self.config.KAFKA_TOPIC) \
             .option("startingOffsets", "earliest") \
+            .option("includeHeaders", str(self.config.HEADER_ROUTING).lower()) \
             .load()
         
         return df
     
-    def transform_data(self, df):
-        print("Applying transformations...")
+    def route_by_headers(self, df):
+        """Expose the producer's headers as columns; null when a message has none"""
+        headers = map_from_entries(col("headers"))
+        return df \
+            .withColumn("header_operation", headers.getItem("operation").cast("string")) \
+            .withColumn("header_collection", headers.getItem("collection").cast("string")) \
+            .withColumn("header_schema_version", headers.getItem("schema_version").cast("string"))
+    
+    def accepted_by_headers(self):
+        """Messages this job parses: order inserts in a schema version it knows.
+        
+        A missing header passes, so messages produced before headers existed
+        still go through the full parse and the operation filter downstream.
+        """
+        operation = col("header_operation")
+        collection = col("header_collection")
+        version = col("header_schema_version")
+        return (operation.isNull() | (operation == "insert")) \
+            & (collection.isNull() | (collection == self.config.SOURCE_COLLECTION)) \
+            & (version.isNull() | version.isin(self.config.schema_versions))
+    
+    def log_header_routing(self, raw_df, batch_id):
+        """Count what the headers dropped; only the small header columns are aggregated"""
+        counts = raw_df.groupBy("header_operation", "header_collection", "header_schema_version").count().collect()
+        
+        unknown_versions = Counter()
+        for row in counts:
+            version = row["header_schema_version"]
+            if version is not None and version not in self.config.schema_versions:
+                unknown_versions[version] += row["count"]
+            elif row["header_operation"] in ("update", "delete"):
+                self.stats[f"skipped_{row['header_operation']}"] += row["count"]
+            elif row["header_operation"] not in (None, "insert"):
+                self.stats['skipped_other_operations'] += row["count"]
+            elif row["header_collection"] not in (None, self.config.SOURCE_COLLECTION):
+                self.stats['skipped_other_collections'] += row["count"]
         
-        cdc_schema = self.define_schema()
+        if unknown_versions:
+            self.stats['unknown_schema_version'] += sum(unknown_versions.values())
+            log.warning("dropping messages with unknown schema_version", extra={'fields': {
+                'batch_id': batch_id,
+                'versions': dict(unknown_versions),
+                'supported': self.config.schema_versions,
+            }})
+    
+    def parse_inserts(self, df):
+        if self.config.HEADER_ROUTING:
+            # Dropped on the headers alone, before any JSON is decoded
+            df = df.filter(self.accepted_by_headers())
         
-        parsed_df = df.select(
-            from_json(col("value").cast("string"), cdc_schema).alias("cdc_event")
+        return df.select(
+            from_json(col("value").cast("string"), self.define_schema()).alias("cdc_event")
         )
+    
+    def transform_data(self, df):
+        parsed_df = self.parse_inserts(df)
         
         flattened_df = parsed_df.select(
             col("cdc_event.operation").alias("operation"),
@@ -105,6 +183,9 @@ class SparkCDCProcessor:
         )
         
         final_df = exploded_df.select(
+            xxhash64(col("order_id")).alias("order_key"),
+            xxhash64(col("user_id")).alias("user_key"),
+            xxhash64(col("item.product_id")).alias("product_key"),
             col("mongodb_id"),
             col("order_id"),
             col("user_id"),
@@ -122,87 +203,161 @@ class SparkCDCProcessor:
         
         return final_df
     
-    def print_batch_data(self, batch_df, batch_id):
-        """Print detailed information about processed batch"""
-        self.batch_counter += 1
+    def build_product_dim(self, batch_df):
+        return batch_df.select("product_key", "product_id", "product_name") \
+            .dropDuplicates(["product_key"])
+    
+    def build_user_dim(self, batch_df):
+        return batch_df.groupBy("user_key", "user_id") \
+            .agg(spark_min("created_at").alias("first_order_at"))
+    
+    def build_order_dim(self, batch_df):
+        return batch_df.select(
+            "order_key", "order_id", "mongodb_id", "user_key",
+            "amount", "status", "created_at", "updated_at"
+        ).dropDuplicates(["order_key"])
+    
+    def load_dimension_state(self, path, key, compare_columns, empty_df):
+        """Latest known version of every key already written to a dimension"""
+        if not os.path.exists(path):
+            return empty_df.select(*compare_columns).limit(0).localCheckpoint()
         
-        print("\n" + "="*80)
-        print(f"PROCESSING BATCH #{self.batch_counter} (Batch ID: {batch_id})")
-        print("="*80)
+        latest = Window.partitionBy(key).orderBy(col("processed_at").desc())
+        return self.spark.read.parquet(path) \
+            .withColumn("_rn", row_number().over(latest)) \
+            .filter(col("_rn") == 1) \
+            .select(*compare_columns) \
+            .localCheckpoint()
+    
+    def upsert_dimension(self, name, rows_df, path, key, compare_columns, broadcast_known=False):
+        """Append only new or changed dimension rows; returns the number written.
         
-        rows = batch_df.collect()
-        row_count = len(rows)
+        With broadcast_known the known state is broadcast into the anti-join
+        instead of shuffling the batch against it; only for dimensions that
+        stay small, such as products. Columns are compared null-safe, so a
+        row with a missing name is not seen as changed in every batch.
+        """
+        if name not in self.dimension_state:
+            self.dimension_state[name] = self.load_dimension_state(path, key, compare_columns, rows_df)
+        known_df = self.dimension_state[name]
         
-        print(f"Batch Size: {row_count} rows")
-        print(f"Processing Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        known = known_df.alias("known")
+        if broadcast_known:
+            known = broadcast(known)
+        unchanged = [col(f"row.{c}").eqNullSafe(col(f"known.{c}")) for c in compare_columns]
+        changed_df = rows_df.alias("row") \
+            .join(known, on=unchanged, how="left_anti") \
+            .withColumn("processed_at", current_timestamp()) \
+            .localCheckpoint()
         
-        if row_count > 0:
-            print("\n--- INPUT DATA (from Kafka) ---")
-            print(f"Source: Kafka topic '{self.config.KAFKA_TOPIC}'")
-            print(f"Records received: {row_count}")
-            
-            print("\n--- OUTPUT SCHEMA ---")
-            batch_df.printSchema()
-            
-            print("\n--- TRANSFORMED DATA (first 5 rows) ---")
-            for idx, row in enumerate(rows[:5], 1):
-                print(f"\nRow {idx}:")
-                print(f"  MongoDB ID: {row['mongodb_id']}")
-                print(f"  Order ID: {row['order_id']}")
-                print(f"  User ID: {row['user_id']}")
-                print(f"  Product: {row['product_name']} (ID: {row['product_id']})")
-                print(f"  Quantity: {row['quantity']}")
-                print(f"  Price: ${row['price']:.2f}")
-                print(f"  Line Total: ${row['line_total']:.2f}")
-                print(f"  Order Amount: ${row['amount']:.2f}")
-                print(f"  Status: {row['status']}")
-                print(f"  Created: {row['created_at']}")
-                print(f"  Processed: {row['processed_at']}")
-            
-            if row_count > 5:
-                print(f"\n  ... and {row_count - 5} more rows")
-            
-            print("\n--- BATCH STATISTICS ---")
-            total_amount = sum(row['line_total'] for row in rows)
-            unique_orders = len(set(row['order_id'] for row in rows))
-            unique_products = len(set(row['product_id'] for row in rows))
-            
-            print(f"  Unique Orders: {unique_orders}")
-            print(f"  Unique Products: {unique_products}")
-            print(f"  Total Line Amount: ${total_amount:.2f}")
-            print(f"  Average Line Total: ${total_amount/row_count:.2f}")
-            
-            print("\n--- TRANSFORMATIONS APPLIED ---")
-            print("  1. Parsed JSON from Kafka message")
-            print("  2. Flattened CDC event structure")
-            print("  3. Filtered for 'insert' operations only")
-            print("  4. Exploded items array (denormalized)")
-            print("  5. Calculated line_total (quantity * price)")
-            print("  6. Added processed_at timestamp")
-            
-            print(f"\n--- OUTPUT DESTINATION ---")
-            print(f"  Format: Parquet")
-            print(f"  Path: {self.config.OUTPUT_PATH}")
-            print(f"  Mode: Append")
-        else:
-            print("No data in this batch")
+        changed_count = changed_df.count()
+        if changed_count == 0:
+            return 0
+        
+        changed_df.write.mode("append").parquet(path)
+        
+        self.dimension_state[name] = known_df \
+            .join(changed_df.select(key), on=key, how="left_anti") \
+            .unionByName(changed_df.select(*compare_columns)) \
+            .localCheckpoint()
         
-        print("="*80 + "\n")
+        return changed_count
+    
+    def write_star_schema(self, batch_df):
+        # Dimensions first: the loader picks up whatever files exist when it
+        # polls, and fact rows must not arrive before the keys they reference.
+        new_products = self.upsert_dimension(
+            "product_dim", self.build_product_dim(batch_df), self.config.PRODUCT_DIM_PATH,
+            key="product_key", compare_columns=["product_key", "product_id", "product_name"],
+            broadcast_known=True
+        )
+        new_users = self.upsert_dimension(
+            "user_dim", self.build_user_dim(batch_df), self.config.USER_DIM_PATH,
+            key="user_key", compare_columns=["user_key", "user_id"]
+        )
+        
+        # Orders are insert-only and already unique per batch, so the loader
+        # appends order_dim like the fact.
+        self.build_order_dim(batch_df) \
+            .withColumn("processed_at", current_timestamp()) \
+            .write \
+            .mode("append") \
+            .parquet(self.config.ORDER_DIM_PATH)
+        
+        batch_df.select(*self.FACT_COLUMNS) \
+            .write \
+            .mode("append") \
+            .parquet(self.config.OUTPUT_PATH)
+        
+        return new_products, new_users
+    
+    def batch_statistics(self, batch_df):
+        """Aggregate on the executors instead of collecting the batch to the driver"""
+        stats = batch_df.agg(
+            countDistinct("order_key").alias("unique_orders"),
+            countDistinct("product_key").alias("unique_products"),
+            spark_sum("line_total").alias("total_line_amount")
+        ).first()
+        return {
+            'unique_orders': stats['unique_orders'],
+            'unique_products': stats['unique_products'],
+            'total_line_amount': round(stats['total_line_amount'] or 0.0, 2),
+        }
+    
+    def log_sample_rows(self, batch_df, batch_id):
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        for row in batch_df.take(5):
+            log.debug("sample row", extra={'sampled': True, 'fields': {
+                'batch_id': batch_id,
+                'row': row.asDict(),
+            }})
+    
+    def summary_stats(self):
+        stats = dict(self.stats)
+        stats['batches'] = self.batch_counter
+        return stats
     
     def write_to_warehouse(self, df):
-        print(f"Writing to warehouse at: {self.config.OUTPUT_PATH}")
+        log.info("writing to warehouse", extra={'fields': {
+            'format': 'parquet',
+            'fact_path': self.config.OUTPUT_PATH,
+            'dimension_paths': [self.config.PRODUCT_DIM_PATH, self.config.USER_DIM_PATH, self.config.ORDER_DIM_PATH],
+        }})
         
-        def process_batch(batch_df, batch_id):
-            if batch_df.count() > 0:
-                self.print_batch_data(batch_df, batch_id)
+        def process_batch(raw_df, batch_id):
+            started = time.time()
+            if self.config.HEADER_ROUTING:
+                raw_df.persist()
+                self.log_header_routing(raw_df, batch_id)
+            
+            batch_df = self.transform_data(raw_df)
+            batch_df.persist()
+            row_count = batch_df.count()
+            if row_count > 0:
+                self.batch_counter += 1
+                self.log_sample_rows(batch_df, batch_id)
+                
+                new_products, new_users = self.write_star_schema(batch_df)
                 
-                batch_df.write \
-                    .mode("append") \
-                    .parquet(self.config.OUTPUT_PATH)
+                self.stats['rows_written'] += row_count
+                self.stats['new_products'] += new_products
+                self.stats['new_users'] += new_users
                 
-                print(f"BATCH #{self.batch_counter} WRITTEN TO PARQUET")
-                print(f"  Location: {self.config.OUTPUT_PATH}")
-                print(f"  Rows written: {batch_df.count()}\n")
+                fields = {
+                    'batch_number': self.batch_counter,
+                    'batch_id': batch_id,
+                    'rows': row_count,
+                    'new_products': new_products,
+                    'new_users': new_users,
+                    'duration_ms': int((time.time() - started) * 1000),
+                }
+                fields.update(self.batch_statistics(batch_df))
+                log.info("batch written", extra={'fields': fields})
+            else:
+                self.stats['empty_batches'] += 1
+            batch_df.unpersist()
+            raw_df.unpersist()
         
         query = df \
             .writeStream \
@@ -214,44 +369,48 @@ class SparkCDCProcessor:
         return query
     
     def run(self):
+        setup_logging(
+            'spark-processor',
+            level=self.config.LOG_LEVEL,
+            queue_size=self.config.LOG_QUEUE_SIZE,
+            sampled_per_second=self.config.LOG_SAMPLED_PER_SECOND
+        )
+        
         try:
-            print("\n" + "="*80)
-            print("SPARK PROCESSOR STARTED")
-            print("="*80)
-            print(f"Application: {self.config.SPARK_APP_NAME}")
-            print(f"Kafka Source: {self.config.KAFKA_BOOTSTRAP_SERVERS}")
-            print(f"Kafka Topic: {self.config.KAFKA_TOPIC}")
-            print(f"Output Path: {self.config.OUTPUT_PATH}")
-            print(f"Checkpoint: {self.config.CHECKPOINT_LOCATION}")
-            print("="*80 + "\n")
+            log.info("spark processor started", extra={'fields': {
+                'application': self.config.SPARK_APP_NAME,
+                'kafka_brokers': self.config.KAFKA_BOOTSTRAP_SERVERS,
+                'kafka_topic': self.config.KAFKA_TOPIC,
+                'output_path': self.config.OUTPUT_PATH,
+                'checkpoint': self.config.CHECKPOINT_LOCATION,
+            }})
             
             self.create_spark_session()
             
             kafka_df = self.read_from_kafka()
+            if self.config.HEADER_ROUTING:
+                kafka_df = self.route_by_headers(kafka_df)
             
-            transformed_df = self.transform_data(kafka_df)
-            
-            query = self.write_to_warehouse(transformed_df)
+            # Parsing and the star schema writes happen per micro-batch, so the
+            # header counts and the parse read the same cached batch
+            query = self.write_to_warehouse(kafka_df)
+            self.summary = LogSummary(log, self.config.LOG_SUMMARY_INTERVAL, self.summary_stats).start()
             
-            print("Spark streaming job started successfully")
-            print("Waiting for data from Kafka...\n")
+            log.info("spark streaming job started, waiting for data from kafka")
             
             query.awaitTermination()
             
         except KeyboardInterrupt:
-            print("\n\n" + "="*80)
-            print("Spark Processor Shutting Down")
-            print(f"   Total Batches Processed: {self.batch_counter}")
-            print("="*80)
-        except Exception as e:
-            print(f"Fatal error: {e}")
-            import traceback
-            traceback.print_exc()
+            log.info("spark processor shutting down", extra={'fields': {'batches_processed': self.batch_counter}})
+        except Exception:
+            log.exception("fatal error")
             sys.exit(1)
         finally:
+            if self.summary:
+                self.summary.stop()
             if self.spark:
                 self.spark.stop()
-            print("Spark processor stopped\n")
+            log.info("spark processor stopped")
 
 if __name__ == "__main__":
     processor = SparkCDCProcessor()